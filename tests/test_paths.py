@@ -1,11 +1,36 @@
+import io
+import json
+import os
+import tempfile
 import unittest
 
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from copy import deepcopy
 
 from tests.samples import agenda
 from tests.samples import google_route
+from wildpath import containers, indexsets
+from wildpath.containers import MappingHandler
+from wildpath.diff import diff, Change
+from wildpath.document import Document
 from wildpath.keyparser import KeyParser
+from wildpath.jsonstream import iter_json, JSONScanner
+from wildpath.jsonview import JSONDocument, JSONObject, JSONArray
 from wildpath.paths import Path, WildPath
+from wildpath.patch import Patch
+from wildpath.pathset import PathSet
+from wildpath.patterns import PatternIndex
+from wildpath.plan import KeyStep, IndexStep, WildStep
+from wildpath.tools import LRUCache, flatten, iter_flat
+
+
+def leaves(result, depth):
+    """ the values in the result of WildPath.get_in at nesting depth 'depth' """
+    if depth < 0:
+        return [result]
+    values = result.values() if isinstance(result, dict) else result
+    return [leaf for value in values for leaf in leaves(value, depth - 1)]
 
 
 class Object(object):
@@ -53,6 +78,34 @@ class TestBase(unittest.TestCase):
         self.agenda = agenda
         self.google_route = google_route
 
+    @contextmanager
+    def counting_dict(self, counted="get"):
+        """
+        Registers a dict subclass with a handler that records its 'get' calls (the keys) or its 'items' calls (the
+        objects); yields the class and the list of records.
+        """
+        visited = []
+
+        class CountingHandler(MappingHandler):
+            def get(self, obj, key):
+                if counted == "get":
+                    visited.append(key)
+                return obj[key]
+
+            def items(self, obj, _call=False):
+                if counted == "items":
+                    visited.append(obj)
+                return obj.items()
+
+        class CountingDict(dict):
+            pass
+
+        containers.register(CountingDict, CountingHandler())
+        try:
+            yield CountingDict, visited
+        finally:
+            containers.unregister(CountingDict)
+
 
 class TestPath(TestBase):
 
@@ -143,6 +196,83 @@ class TestPath(TestBase):
         with self.assertRaises(AttributeError):
             Path("e.2.x").get_in(s)
 
+    def test_compile(self):
+        s = deepcopy(self.simple)
+        s.g = (dict(a=OrderedDict(b=1)), [Object(c=2)])
+        for path_string in ["b.0", "c.d", "d.e", "e.1.b", "g.0.a.b", "g.1.0.c", "f.1.0.a.1"]:
+            path = Path(path_string)
+            expected = path.get_in(s)
+            accessor = path.compile()
+            self.assertIs(path.compile(), accessor)
+            self.assertEqual(path.get_in(s), expected)
+            path.set_in(s, "x")
+            self.assertEqual(Path(path_string).get_in(s), "x")
+            path.del_in(s)
+            self.assertNotEqual(Path(path_string).get_in(s, None), "x")
+
+    def test_compiled_exceptions(self):
+        s = deepcopy(self.simple)
+        for path_string, exception in [("e.1.a", KeyError), ("e.5.a", IndexError), ("e.2.x", AttributeError)]:
+            path = Path(path_string)
+            path.compile()
+            with self.assertRaises(exception):
+                path.get_in(s)
+            self.assertEqual(path.get_in(s, "default"), "default")
+
+    def test_probe(self):
+        s = deepcopy(self.simple)
+        self.assertEqual(containers.handler_for({}).probe({"a": 1}, "b", 2), 2)
+        self.assertEqual(containers.handler_for([]).probe([1, 2], -3, 0), 0)
+        self.assertEqual(containers.handler_for([]).probe([1, 2], -2, 0), 1)
+        self.assertEqual(containers.handler_for(s).probe(s, "x", 0), 0)
+        counts = defaultdict(int)
+        self.assertEqual(Path("a").get_in(counts, 1), 0)  # as obj["a"]: defaultdict creates missing values
+        self.assertEqual(dict(counts), {"a": 0})
+
+    def test_default_without_exceptions(self):
+        class StrictHandler(MappingHandler):
+            def get(self, obj, key):
+                raise AssertionError("lookups with a default should probe")
+
+            def probe(self, obj, key, default=None):
+                return obj.get(key, default)
+
+        class StrictDict(dict):
+            pass
+
+        containers.register(StrictDict, StrictHandler())
+        try:
+            obj = StrictDict(a=StrictDict(b=1))
+            for path in [Path("a.b"), Path("a.c.d"), Path("x.0")]:
+                for _ in range(2):  # generic and compiled
+                    self.assertEqual(path.get_in(obj, "d"), 1 if path == Path("a.b") else "d")
+                    path.compile()
+            obj = {"a": [{"b": 1}], "c": (1,)}
+            for path_string in ["a.0.b", "a.1.b", "a.-2.b", "a.0.c", "c.0", "c.-2"]:
+                path = Path(path_string)
+                expected = path.get_in(obj, "d")
+                path.compile()
+                self.assertEqual(path.get_in(obj, "d"), expected)
+            self.assertEqual(WildPath("a.b*.c").get_in({"a": {"b": StrictDict(), "bb": StrictDict(c=2)}}, 0),
+                             {"b": 0, "bb": 2})  # the default is for the last key
+            self.assertEqual(PathSet(["a.b", "a.c"]).get_in(StrictDict(a=StrictDict(b=1)), 0),
+                             {WildPath("a.b"): 1, WildPath("a.c"): 0})
+            self.assertTrue(WildPath("a").has_in(StrictDict(a=1)))
+        finally:
+            containers.unregister(StrictDict)
+
+    def test_cached(self):
+        Path.clear_cache()
+        path = Path.cached("items.0.name")
+        self.assertIs(Path.cached("items.0.name"), path)
+        self.assertIsNot(WildPath.cached("items.0.name"), path)
+        self.assertIsInstance(WildPath.cached("items.0.name"), WildPath)
+        self.assertEqual(path.get_in(self.agenda), "opening")
+        self.assertEqual(Path.instance_cache.stats()["hits"], 2)
+        Path.clear_cache()
+        self.assertIsNot(Path.cached("items.0.name"), path)
+
+
 class TestWildPath(TestBase):
 
     def test_pop(self):
@@ -406,6 +536,26 @@ class TestWildPath(TestBase):
         path = WildPath("f.*.*.*")
         self.assertTrue(all(isinstance(p, list) for p in path.get_in(obj, flat=True)))
 
+    def test_flat_large(self):
+        obj = {"a": [{"b": [{"c": i, "d": str(i)} for i in range(100)]} for _ in range(100)]}
+        path = WildPath("a.*.b.*.c|d")
+        flat = path.get_in(obj, flat=True)
+        self.assertEqual(len(flat), 20000)
+        self.assertEqual(sorted(flat, key=str), sorted(flatten(path.get_in(obj), depth=path.depth), key=str))
+        self.assertEqual(WildPath("a.0.b.0.d").get_in(obj, flat=True), ["0"])
+        self.assertEqual(WildPath("a.0.b.0.x").get_in(obj, default=None, flat=True), [None])
+        self.assertEqual(WildPath("").get_in(obj, flat=True), [obj])
+
+    def test_flatten(self):
+        self.assertEqual(flatten({"a": "abc", "b": ["de", ["f"]], "c": b"g"}), ["abc", "de", "f", b"g"])  # no duplicates
+        self.assertEqual(flatten([[1, [2]], [3]], depth=0), [[1, [2]], [3]])
+        self.assertEqual(flatten([[1, [2]], [3]], depth=1), [1, [2], 3])
+        self.assertEqual(flatten("abc"), ["abc"])
+        deep = [1]
+        for _ in range(10000):
+            deep = [deep, 2]
+        self.assertEqual(sum(iter_flat(deep)), 20001)
+
     def test_call_in(self):
         special = Object(s=0)
         special.sub = lambda x, y: x-y
@@ -418,10 +568,262 @@ class TestWildPath(TestBase):
         path = WildPath("*.c.sub")
         self.assertEqual(path.call_in(obj, 2, y=1), [1, 1])
 
+    def test_call_in_containers(self):
+        def one():
+            return 1
+        self.assertEqual(WildPath("a").call_in({"a": [one, one]}), [1, 1])
+        self.assertEqual(WildPath("*").call_in({"a": {"b": one}, "c": one}), {"a": {"b": 1}, "c": 1})
+
+    def test_apply_in(self):
+        obj = {"a": [1, 2, 3], "b": {"c": 4, "d": 5}}
+        WildPath("a.1:").apply_in(obj, lambda v: v * 10)
+        WildPath("b.!d").apply_in(obj, str)
+        Path("b.d").apply_in(obj, lambda v: -v)
+        self.assertEqual(obj, {"a": [1, 20, 30], "b": {"c": "4", "d": -5}})
+        with self.assertRaises(KeyError):
+            Path("b.e").apply_in(obj, str)
+
+    def test_set_copy(self):
+        obj = {"a": {"b": [{"c": 1}, {"c": 2}], "d": {"e": 3}}, "f": Object(g=4), "h": [5]}
+        original = deepcopy(obj)
+        for path in [Path("a.b.1.c"), WildPath("a.b.1.c")]:
+            new = path.set_in(obj, 0, copy=True)
+            self.assertEqual(obj, original)
+            self.assertEqual(new["a"]["b"], [{"c": 1}, {"c": 0}])
+            self.assertIsNot(new["a"]["b"], obj["a"]["b"])
+            self.assertIs(new["a"]["b"][0], obj["a"]["b"][0])  # unchanged parts are shared
+            self.assertIs(new["a"]["d"], obj["a"]["d"])
+            self.assertIs(new["h"], obj["h"])
+        new = WildPath("a.b.*.c").set_in(obj, 0, copy=True)
+        self.assertEqual(new["a"]["b"], [{"c": 0}, {"c": 0}])
+        self.assertIs(new["a"]["d"], obj["a"]["d"])
+        new = WildPath("f.g").set_in(obj, 5, copy=True)
+        self.assertEqual((obj["f"].g, new["f"].g), (4, 5))
+        self.assertIs(WildPath("a.x*.c").set_in(obj, 0, copy=True), obj)  # nothing selected: nothing copied
+        self.assertEqual(WildPath("a.d.x").set_in(obj, 0, copy=True)["a"]["d"], {"e": 3, "x": 0})
+        self.assertEqual(obj, original)
+
+    def test_del_copy(self):
+        obj = {"a": {"b": [{"c": 1}, {"c": 2}], "d": {"e": 3}}, "h": [5]}
+        original = deepcopy(obj)
+        for path in [Path("a.b.0"), WildPath("a.b.0")]:
+            new = path.del_in(obj, copy=True)
+            self.assertEqual(new["a"]["b"], [{"c": 2}])
+            self.assertIs(new["a"]["b"][0], obj["a"]["b"][1])
+            self.assertIs(new["a"]["d"], obj["a"]["d"])
+        new = WildPath("a.d|x.e").del_in(obj, copy=True)
+        self.assertEqual(new["a"], {"b": [{"c": 1}, {"c": 2}], "d": {}})
+        self.assertIs(new["a"]["b"], obj["a"]["b"])
+        self.assertEqual(WildPath("a.b.:").del_in(obj, copy=True), {"a": {"b": [], "d": {"e": 3}}, "h": [5]})
+        self.assertEqual(obj, original)
+        with self.assertRaises(KeyError):
+            Path("a.x").del_in(obj, copy=True)
+
+    def test_matches(self):
+        self.assertTrue(WildPath("a.*.c").matches("a.b.c"))
+        self.assertTrue(WildPath("a.*.c").matches(Path("a.3.c")))
+        self.assertFalse(WildPath("a.*.c").matches("a.b"))
+        self.assertFalse(WildPath("a.*.c").matches("a.b.c.d"))
+        self.assertTrue(WildPath("a.1:5:2.b*&!bb").matches(("a", 3, "bc")))
+        self.assertFalse(WildPath("a.1:5:2.b*&!bb").matches("a.2.bc"))
+        self.assertFalse(WildPath("a.1:5:2.b*&!bb").matches("a.3.bb"))
+        self.assertTrue(WildPath("!0").matches("1"))
+        self.assertFalse(WildPath("!0").matches("0"))
+        self.assertFalse(WildPath("-1").matches("3"))  # depends on the length
+        self.assertTrue(WildPath("").matches(Path()))
+
+    def test_matches_items(self):
+        paths = set(Path.paths(google_route, all=True))
+        for path_string in ["routes.0.legs.*.steps.*.distance", "routes.*.legs.0.steps.1:3.*_location.lat|lng",
+                            "*.0.bounds.!northeast", "routes.0.legs.0.steps.!0&!5.travel_mode", "status"]:
+            wildpath = WildPath(path_string)
+            selected = set(path for path, _ in wildpath.match_items(google_route))
+            self.assertEqual(set(path for path in paths if wildpath.matches(path)), selected)
+
+    def test_pop_single_pass(self):
+        with self.counting_dict() as (CountingDict, visited):
+            obj = CountingDict(a=CountingDict(b=CountingDict(c=1, d=2)))
+            self.assertEqual(WildPath("a.b.c|d").pop_in(obj), {"c": 1, "d": 2})
+            self.assertEqual(sorted(visited), ["a", "b", "c", "d"])  # every key is looked up once
+            self.assertEqual(obj, {"a": {"b": {}}})
+            del visited[:]
+            obj["a"]["b"]["e"] = 3
+            self.assertEqual(Path("a.b.e").pop_in(obj), 3)
+            self.assertEqual(visited, ["a", "b", "e"])
+            self.assertEqual(obj, {"a": {"b": {}}})
+
+    def test_compile(self):
+        path = WildPath("items.0.na*|subjects")
+        plan = path.compile()
+        self.assertIs(path.compile(), plan)
+        self.assertEqual([type(step) for step in plan], [KeyStep, IndexStep, WildStep])
+        self.assertEqual(plan[1].index, 0)
+        self.assertEqual(plan.depth, path.depth)
+
+    def test_compiled_no_new_paths(self):
+        obj = deepcopy(self.google_route)
+        path = WildPath("routes.*.legs.*.steps.*.*_location")
+        path.compile()
+        original_new = WildPath.__new__
+        created = []
+
+        def counting_new(cls, *args, **kwargs):
+            created.append(args)
+            return original_new(cls, *args, **kwargs)
+
+        WildPath.__new__ = staticmethod(counting_new)
+        try:
+            result = path.get_in(obj)
+            path.set_in(obj, result)
+            path.del_in(obj)
+        finally:
+            WildPath.__new__ = staticmethod(original_new)
+        self.assertEqual(created, [])
+        self.assertEqual(WildPath("routes.*.legs.*.steps.*.*_location").get_in(obj), [[[{}] * 14]])
+
+    def test_key_cache(self):
+        original = WildPath.key_cache
+        WildPath.key_cache = LRUCache(maxsize=2)
+        try:
+            paths = [WildPath("a*.b%d*" % i) for i in range(3)]
+            self.assertEqual(WildPath.key_cache_stats(),
+                             dict(hits=0, misses=5, evictions=3, size=2, maxsize=2))  # "a*" is parsed again once
+            WildPath("b2*")  # construction only parses keys that are not in the cache, it does not count hits
+            self.assertEqual(WildPath.key_cache_stats()["hits"], 0)
+            paths[2].compile()
+            self.assertEqual(WildPath.key_cache_stats()["hits"], 2)
+            obj = dict(aa=dict(b0=0, b1=1, b2=2))
+            self.assertEqual([path.get_in(obj) for path in paths], [{"aa": {"b%d" % i: i}} for i in range(3)])
+            evictions = WildPath.key_cache_stats()["evictions"]
+            WildPath.key_cache.resize(1)
+            self.assertEqual(len(WildPath.key_cache), 1)
+            self.assertEqual(WildPath.key_cache_stats()["evictions"], evictions + 1)
+        finally:
+            WildPath.key_cache = original
+
+    def test_set_through_literal_keys(self):
+        obj = {"a": {"b": {"c": 1}}}
+        WildPath("a.b").set_in(obj, {"x": 2})
+        self.assertEqual(obj, {"a": {"b": {"x": 2}}})
+        obj = {"a": [[1], [2]]}
+        WildPath("a.0").set_in(obj, [3, 4])
+        self.assertEqual(obj, {"a": [[3, 4], [2]]})
+
+    def test_match_items(self):
+        for string in ["routes.*.legs.*.steps.*.distance", "routes.0.legs.0.steps.!(::2|-1).*_location.lat",
+                       "routes.0.bounds|summary|nothing", "routes.0.legs.0.steps.-1.end_location.*", "status",
+                       "routes.*.legs.0.x|y|distance"]:
+            path = WildPath(string)
+            items = list(path.match_items(google_route))
+            self.assertEqual(sorted((v for _, v in items), key=repr),
+                             sorted(leaves(path.get_in(google_route), path.depth), key=repr))
+            for concrete_path, value in items:
+                self.assertIsInstance(concrete_path, Path)
+                self.assertEqual(len(concrete_path), len(path))
+                self.assertEqual(concrete_path.get_in(google_route), value)
+        self.assertEqual([str(p) for p, _ in WildPath("routes.0.legs.0.steps.1:4.duration").match_items(google_route)],
+                         ["routes.0.legs.0.steps.%d.duration" % i for i in range(1, 4)])  # in order
+        self.assertEqual(len(list(WildPath("*.0.legs.0.steps.-1").match_items(google_route))), 1)  # no KeyError
+        self.assertEqual(list(WildPath("routes.0.legs.0.steps.x|y").match_items(google_route)), [])  # no ValueError
+        self.assertEqual(list(WildPath("").match_items(google_route)), [(Path(), google_route)])
+        self.assertEqual(list(WildPath("a.*").match_items({"a": "string", "b": 1})), [])  # leaves are not iterated into
+        self.assertEqual(len(list(WildPath.items(google_route))), len(list(Path.items(google_route))))
+        self.assertEqual(list(WildPath("status").items(google_route)), list(WildPath.items(google_route)))
+
+    def test_iter_in(self):
+        path = WildPath("routes.*.legs.*.steps.*.distance.value")
+        values = [step["distance"]["value"] for step in google_route["routes"][0]["legs"][0]["steps"]]
+        self.assertEqual([v for _, v in path.iter_in(google_route)], values)  # in document order
+        self.assertEqual([str(p) for p, _ in path.iter_in(google_route, limit=2)],
+                         ["routes.0.legs.0.steps.0.distance.value", "routes.0.legs.0.steps.1.distance.value"])
+        self.assertEqual(path.first_in(google_route), values[0])
+        self.assertEqual(WildPath("routes.*.nothing").first_in(google_route, None), None)
+        with self.assertRaises(KeyError):
+            WildPath("routes.*.nothing").first_in(google_route)
+
+    def test_has_in(self):
+        obj = {"a": [{"b": 1, "c": 2}, {"b": 3}], "d": {}}
+        for string, all_, any_ in [("a.*.b", True, True), ("a.*.c", False, True), ("a.*.x", False, False),
+                                   ("d.*", True, False), ("d.*.x", True, False), ("a.0|1.c", False, True),
+                                   ("x.*", False, False), ("a.1", True, True), ("", True, True)]:
+            path = WildPath(string)
+            self.assertEqual(path.has_in(obj), all_, string)
+            self.assertEqual(path.has_in(obj, any=True), any_, string)
+            try:
+                path.get_in(obj)
+            except (KeyError, IndexError, AttributeError):
+                self.assertFalse(all_)
+            else:
+                self.assertTrue(all_)
+
+    def test_has_in_short_circuit(self):
+        with self.counting_dict() as (CountingDict, visited):
+            obj = [CountingDict(v=i) for i in range(100)]
+            del obj[1]["v"]
+            self.assertFalse(WildPath("*.v").has_in(obj))
+            self.assertEqual(len(visited), 2)  # stops at the missing key in the second item
+            self.assertTrue(WildPath("*.v").has_in(obj, any=True))
+            self.assertEqual(len(visited), 3)
+
+    def test_match_items_concrete_indices(self):
+        obj = {"steps": [{"polyline": "a"}, {"polyline": "b"}, {"polyline": "c"}]}
+        for string in ["steps.-1.polyline", "steps.2.polyline", "steps.02.polyline", "steps.-1|-3.polyline"]:
+            items = list(WildPath(string).match_items(obj))
+            self.assertEqual(items, list(iter_json(json.dumps(obj), string)))
+            for path, value in items:
+                self.assertEqual(path.get_in(obj), value)
+        self.assertEqual(list(WildPath("steps.-1.polyline").match_items(obj)), [(Path("steps.2.polyline"), "c")])
+        self.assertEqual(list(WildPath("steps.-4.polyline").match_items(obj)), [])
+
+    def test_iter_in_lazy(self):
+        with self.counting_dict() as (CountingDict, visited):
+            obj = {"a": [CountingDict(v=i) for i in range(100)]}
+            self.assertTrue(any(value > 2 for _, value in WildPath("a.*.v").iter_in(obj)))
+            self.assertEqual(len(visited), 4)
+            self.assertEqual(WildPath("a.*.v").first_in(obj), 0)
+            self.assertEqual(len(visited), 5)
+            self.assertEqual(len(list(WildPath("a.*.v").iter_in(obj, limit=5))), 5)
+            self.assertEqual(len(visited), 10)
+
+    def test_match_items_pruned(self):
+        with self.counting_dict() as (CountingDict, visited):
+            obj = CountingDict((k, CountingDict(a=CountingDict(b=1), c=2)) for k in "pqrs")
+            self.assertEqual(dict(WildPath("!s.a*.b").match_items(obj)),
+                             {Path("p.a.b"): 1, Path("q.a.b"): 1, Path("r.a.b"): 1})
+            self.assertEqual(sorted(visited), sorted("pqr" + "aaa" + "bbb"))
 
 
 class TestIterators(TestBase):
 
+    def test_deep(self):
+        obj = value = {}
+        for i in range(10000):
+            value["a"] = [{}]
+            value = value["a"][0]
+        value["b"] = 1
+        self.assertEqual(list(Path.values(obj)), [1])
+        path = next(Path.paths(obj))
+        self.assertEqual(len(path), 20001)
+        self.assertEqual(path.get_in(obj), 1)
+        self.assertEqual(len(list(Path.items(path[:19000].get_in(obj), all=True))), 1001)
+
+    def test_circular(self):
+        obj = {"a": {"b": 1}, "c": [2]}
+        obj["a"]["d"] = obj
+        obj["c"].append(obj["c"])
+        self.assertEqual(sorted((str(p), v is obj or v is obj["c"] or v) for p, v in Path.items(obj)),
+                         [("a.b", 1), ("a.d", True), ("c.0", 2), ("c.1", True)])
+        self.assertEqual(len(list(Path.items(obj, all=True))), 6)
+
+    def test_unique(self):
+        shared = {"x": 1, "y": [2]}
+        obj = {"a": shared, "b": [shared, shared]}
+        self.assertEqual(len(list(Path.paths(obj))), 6)
+        items = dict(Path.items(obj, unique=True))
+        self.assertEqual(len(items), 4)
+        self.assertEqual(sum(v is shared for v in items.values()), 2)
+        self.assertEqual(len(list(Path.paths(obj, all=True, unique=True))), 7)
+
     def test_iteritems_all(self):
         paths = [path for path in Path.items(self.simple, all=True)]
         self.assertEqual(len(paths), 50)
@@ -577,6 +979,80 @@ class TestKeyParser(unittest.TestCase):
             self.assertEqual(expression(*keys), expected)
 
 
+    def test_select_keys(self):
+        keys = {"a": 1, "ab": 2, "ba": 3, "a_location": 4, "b_location": 5, "a[b]": 6}
+        wildkey_expected = {"a": {"a"},
+                            "x": set(),
+                            "a*": {"a", "ab", "a_location", "a[b]"},
+                            "*_location": {"a_location", "b_location"},
+                            "?b": {"ab"},
+                            "*a*&!a*": {"ba", "b_location"},
+                            "a|x|ba": {"a", "ba"},
+                            "[ab]_*": {"a_location", "b_location"}}
+        for wildkey, expected in wildkey_expected.items():
+            expression = self.keyparser.parse(wildkey)
+            self.assertEqual(expression.select_keys(keys), expected)
+            self.assertEqual(expression(*keys), expected)
+
+    def test_select_many_keys(self):
+        keys = dict(("k%d_%s" % (i, "location" if i % 3 else "other"), i) for i in range(30000))
+        expression = self.keyparser.parse("k1*_location")
+        self.assertEqual(expression.select_keys(keys),
+                         set(k for k in keys if k.startswith("k1") and k.endswith("_location")))
+
+    def test_select_non_string_keys(self):
+        expression = self.keyparser.parse("1*")
+        self.assertEqual(expression.select_keys({1: "a", 12: "b", 2: "c"}), {1, 12})
+
+
+class TestIndexSets(unittest.TestCase):
+
+    def setUp(self):
+        self.keyparser = KeyParser()
+
+    def test_select_indices(self):
+        wildkeys = ["*", ":", "1", "-1", "20", "1:7", "::2", "::-3", "-1::-2", "1:7|2:8|3:9", "1:7&2:8&3:9",
+                    "(::2&1:6|2::4)&!4", "!::3&5:|2", "::2&::3", "1::4&3::6", "::4&1::2", "!(::2|::3)", "!1:3",
+                    "::3|1:4", "!-1:0:-2", "2:9:2&3:", "2::3&!(5:7|9)"]
+        for length in [0, 1, 5, 12, 13]:
+            indices = tuple(range(length))
+            for wildkey in wildkeys:
+                expression = self.keyparser.parse(wildkey)
+                expected = sorted(expression(*indices)) if length else []
+                self.assertEqual(list(expression.select_indices(length)), expected, (wildkey, length))
+        self.assertEqual(list(self.keyparser.parse("-20|1").select_indices(5)), [1])  # out of range: not selected
+
+    def test_symbolic(self):
+        self.assertIsInstance(self.keyparser.parse("1:3|5:7").select_indices(10), indexsets.Intervals)
+        self.assertIsInstance(self.keyparser.parse("!(1:3|5:7)").select_indices(10), indexsets.Intervals)
+        self.assertIsInstance(self.keyparser.parse("::2&::3").select_indices(10), indexsets.Progression)
+        self.assertIsInstance(self.keyparser.parse("::2&1:7").select_indices(10), indexsets.Progression)
+
+    def test_large_sequence(self):
+        obj = list(range(10**6))
+        self.assertEqual(WildPath("0:10").get_in(obj), list(range(10)))
+        self.assertEqual(WildPath("-3:").get_in(obj), [999997, 999998, 999999])
+        self.assertEqual(WildPath("::100000&!0").get_in(obj), list(range(100000, 10**6, 100000)))
+        self.assertEqual(WildPath("-1::-400000").get_in(obj), [199999, 599999, 999999])  # in sequence order
+        WildPath("10:|::2").del_in(obj)
+        self.assertEqual(obj, [1, 3, 5, 7, 9])
+
+    def test_bitmap(self):
+        self.assertIsInstance(self.keyparser.parse("!::3&5:|2").select_indices(10), indexsets.Bitmap)
+        bitmap = indexsets.Bitmap.from_indices(8, [1, 4, 6])
+        self.assertEqual(list(bitmap), [1, 4, 6])
+        self.assertEqual(len(bitmap), 3)
+        self.assertTrue(4 in bitmap and 5 not in bitmap and 8 not in bitmap)
+        self.assertEqual(list(~bitmap), [0, 2, 3, 5, 7])
+        self.assertEqual(list(bitmap & indexsets.from_slice(8, slice(None, None, 2))), [4, 6])
+        self.assertEqual(list(bitmap | indexsets.from_index(8, 0)), [0, 1, 4, 6])
+        obj = list(range(10**6))
+        self.assertEqual(len(WildPath("!::3&1:|2").get_in(obj)), 666666)
+        WildPath("!(::3|::5)").del_in(obj)
+        self.assertEqual(obj[:8], [0, 3, 5, 6, 9, 10, 12, 15])
+        self.assertEqual(len(obj), 466667)
+
+
 class TestLogicPath(TestBase):
 
     def test_key_or(self):
@@ -625,6 +1101,30 @@ class TestLogicPath(TestBase):
         path = WildPath("!(::2|::3)")
         self.assertEqual(path.get_in(obj), [1,5,7])
 
+    def test_literal_keys(self):
+
+        class NoIterDict(dict):
+            def __iter__(self):
+                raise AssertionError("keys should be looked up, not iterated over")
+
+        obj = NoIterDict(a=1, b=2, c=3, ab=4)
+        self.assertEqual(WildPath("c|a|x").get_in(obj), dict(a=1, c=3))
+        self.assertEqual(list(WildPath("c|a|x").compile()[0].select(containers.handler_for(obj), obj)), ["c", "a"])
+        self.assertEqual(WildPath("a|ab&!a*").get_in(obj), dict(a=1))
+        self.assertEqual(WildPath("(a|ab)&a*").get_in(obj), dict(a=1, ab=4))
+        self.assertEqual(WildPath("a|b").get_in(Object(a=1, b=2, c=3)), dict(a=1, b=2))
+        self.assertEqual(WildPath("a|add").get_in(Object(a=1)), dict(a=1))  # methods are not selected
+
+    def test_literal_indices(self):
+        obj = list(range(10**6))
+        self.assertEqual(WildPath("-1|0|3|-1|10000000").get_in(obj), [0, 3, 999999])
+        WildPath("-1|0").set_in(obj, ["first", "last"])
+        self.assertEqual(obj[0], "first")
+        self.assertEqual(obj[-1], "last")
+        WildPath("1|-1").del_in(obj)
+        self.assertEqual(len(obj), 999998)
+        self.assertEqual(obj[:2], ["first", 2])
+
     def test_composite_path(self):
         obj = deepcopy(self.agenda)
         path = WildPath("items.0|2.?u*&!*ion.!1:")  # last key: second char == 'u' and ends with 'ion'
@@ -764,6 +1264,434 @@ class TestVarious(unittest.TestCase):
         self.assertEqual(list(Path.items(Test())), [])
 
 
+class Record(object):
+    """ container type that is not a Mapping, used to test registering handlers """
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+
+class RecordHandler(MappingHandler):
+
+    def get(self, obj, key):
+        return obj.fields[key]
+
+    def set(self, obj, key, value):
+        obj.fields[key] = value
+
+    def delete(self, obj, key):
+        del obj.fields[key]
+
+    def keys(self, obj):
+        return obj.fields
+
+    def items(self, obj, _call=False):
+        return obj.fields.items()
+
+    def new(self, obj, items):
+        return Record(**dict(items))
+
+
+class TestContainers(unittest.TestCase):
+
+    def setUp(self):
+        containers.register(Record, RecordHandler())
+
+    def tearDown(self):
+        containers.unregister(Record)
+
+    def test_object_schema(self):
+        class Base(object):
+            k = 3
+
+            def __init__(self, i):
+                self.a, self.c = i, [i]
+                self.f = len
+
+            @property
+            def p(self):
+                return self.a * 2
+
+            def m(self):
+                pass
+
+        class Sub(Base):
+            __slots__ = ()
+
+        class Slots(object):
+            __slots__ = ("x", "y")
+
+            def __init__(self):
+                self.x, self.y = 1, 2
+
+        for obj in [Base(1), Sub(2), Slots()]:
+            expected = {name: getattr(obj, name) for name in dir(obj) if not name.startswith("__")
+                        and not callable(getattr(obj, name))}
+            self.assertEqual(containers.get_object_dict(obj), expected)
+        obj = Base(1)
+        obj.z = 5
+        self.assertEqual(list(containers.get_object_items(obj)), [("a", 1), ("c", [1]), ("f", len), ("p", 2), ("z", 5)])
+        self.assertEqual(list(containers.get_object_items(obj, _call=True)),
+                         [("a", 1), ("c", [1]), ("f", len), ("m", obj.m), ("p", 2), ("z", 5)])
+        self.assertEqual(list(containers.get_object_items(Slots())), [("x", 1), ("y", 2)])
+        self.assertIs(containers.schema_for(Base), containers.schema_for(Base))
+        Base.q = property(lambda self: 7)  # the schema is updated
+        self.assertEqual(WildPath("q|k").get_in(obj), {"q": 7, "k": 3})
+        self.assertEqual(dict(Path.items(obj))[("q",)], 7)
+
+    def test_handler_for(self):
+        self.assertIs(containers.handler_for({}), containers.mapping_handler)
+        self.assertIs(containers.handler_for(OrderedDict()), containers.mapping_handler)
+        self.assertIs(containers.handler_for([]), containers.sequence_handler)
+        self.assertIs(containers.handler_for(()), containers.frozen_sequence_handler)
+        self.assertIs(containers.handler_for("abc"), containers.frozen_value_handler)
+        self.assertIs(containers.handler_for(Object()), containers.object_handler)
+        self.assertIs(containers.handler_for(1), containers.attribute_handler)
+        self.assertIsInstance(containers.handler_for(Record()), RecordHandler)
+
+    def test_registered_paths(self):
+        obj = {"r": Record(a=[1, 2], b=Record(c=3), d=4)}
+        self.assertEqual(Path("r.a.1").get_in(obj), 2)
+        self.assertEqual(WildPath("r.b.c").get_in(obj), 3)
+        self.assertEqual(WildPath("r.!b").get_in(obj).fields, {"a": [1, 2], "d": 4})
+        Path("r.b.c").set_in(obj, 5)
+        WildPath("r.a|d").set_in(obj, {"a": 6, "d": 7})
+        self.assertEqual(dict(Path.items(obj)), {("r", "a"): 6, ("r", "b", "c"): 5, ("r", "d"): 7})
+        WildPath("r.a|b").del_in(obj)
+        self.assertEqual(obj["r"].fields, {"d": 7})
+
+    def test_unregister(self):
+        containers.unregister(Record)
+        self.assertIs(containers.handler_for(Record()), containers.object_handler)
+        self.assertEqual(Path("fields.a").get_in(Record(a=1)), 1)
+
+
+class TestPathSet(TestBase):
+
+    def test_get_in(self):
+        paths = [Path("routes.0.legs.0.distance.text"), WildPath("routes.0.legs.0.steps.*.duration.value"),
+                 WildPath("routes.0.legs.0.steps.1:3.*_location"), WildPath("routes.0.legs.0.steps.0"),
+                 Path("routes.0.summary"), WildPath("routes.0.legs.*.steps.*.distance"), Path("status"), Path("")]
+        pathset = PathSet(paths)
+        self.assertEqual(len(pathset), len(paths))
+        results = pathset.get_in(google_route)
+        self.assertEqual(set(results), set(paths))
+        for path in paths:
+            self.assertEqual(results[path], path.get_in(google_route))
+
+    def test_default(self):
+        obj = {"a": {"b": 1, "c": [1, 2]}, "d": Object(e=2)}
+        pathset = PathSet(["a.b", "a.x", "a.c.5", "d.e", "d.f", "*.b", "a.c.*"])
+        self.assertEqual({str(p): v for p, v in pathset.get_in(obj, None).items()},
+                         {"a.b": 1, "a.x": None, "a.c.5": None, "d.e": 2, "d.f": None, "*.b": {"a": 1, "d": None},
+                          "a.c.*": [1, 2]})
+        with self.assertRaises(KeyError):
+            pathset.get_in(obj)
+
+    def test_path_and_wildpath(self):
+        obj = {"a": {"*": 1, "b": 2}}
+        pathset = PathSet([Path("a.*"), WildPath("a.*"), Path("a.*")])
+        self.assertEqual(len(pathset), 2)
+        self.assertEqual([type(path) for path in pathset], [Path, WildPath])
+        self.assertIn(Path("a.*"), pathset)
+        self.assertIn(WildPath("a.*"), pathset)
+        self.assertEqual(pathset.items(obj), [(Path("a.*"), 1), (WildPath("a.*"), {"*": 1, "b": 2})])
+        self.assertEqual([type(path) for path, _ in pathset.items(obj)], [Path, WildPath])
+        self.assertEqual(len(PathSet([Path("a.b"), WildPath("a.b")])), 1)  # no wild keys: the same path
+
+    def test_single_traversal(self):
+        with self.counting_dict() as (CountingDict, lookups):
+            obj = CountingDict(a=CountingDict(b=CountingDict(c=1, d=2, e=3)))
+            PathSet(["a.b.c", "a.b.d", "a.b.e"]).get_in(obj)
+            self.assertEqual(sorted(lookups), ["a", "b", "c", "d", "e"])
+
+
+class TestDiff(TestBase):
+
+    def test_diff(self):
+        old = {"a": {"b": 1, "c": [1, 2], "d": "x"}, "e": Object(f=1), "g": [1, 2], "h": 1}
+        new = {"a": {"b": 2, "c": [1, 3], "x": None}, "e": Object(f=2), "g": [1], "h": "1"}
+        changes = list(diff(old, new))
+        self.assertEqual(sorted(changes, key=repr), sorted([
+            Change(Path("a.b"), "change", 2), Change(Path("a.c.1"), "change", 3), Change(Path("a.x"), "add", None),
+            Change(Path("a.d"), "remove", None), Change(Path("e.f"), "change", 2), Change(Path("g"), "change", [1]),
+            Change(Path("h"), "change", "1")], key=repr))
+        self.assertEqual(list(diff(old, deepcopy(old))), [])
+        self.assertEqual(list(diff([1], (1,))), [Change(Path(), "change", (1,))])
+
+    def test_root(self):
+        for old, new in [(1, [1]), ({}, []), ({"a": 1}, "a")]:
+            changes = list(diff(old, new))
+            self.assertEqual(changes, [Change(Path(), "change", new)])
+            self.assertEqual(Patch(changes).apply(deepcopy(old)), new)
+        self.assertEqual(Patch([("", "set", {}), ("a", "set", 1)]).apply([]), {"a": 1})
+        with self.assertRaises(ValueError):
+            Patch([(Path(), "del")])
+
+    def test_apply(self):
+        old = deepcopy(google_route)
+        new = WildPath("routes.0.legs.0.steps.*.duration.value").set_in(old, 0, copy=True)
+        new = WildPath("routes.0.legs.0.steps.0|2").del_in(new, copy=True)
+        new = Path("status").del_in(Path("routes.0.summary").set_in(new, "A1", copy=True), copy=True)
+        obj = deepcopy(old)
+        for path, op, value in diff(old, new):
+            if op == "remove":
+                path.del_in(obj)
+            else:
+                path.set_in(obj, value)
+        self.assertEqual(obj, new)
+        self.assertEqual(Patch(diff(old, new)).apply(deepcopy(old)), new)
+
+    def test_shared(self):
+        with self.counting_dict("items") as (CountingDict, visited):
+            old = CountingDict((str(i), CountingDict(v=i, w=CountingDict(x=i))) for i in range(1000))
+            new = Path("500.w.x").set_in(old, -1, copy=True)
+            self.assertEqual(list(diff(old, new)), [Change(Path("500.w.x"), "change", -1)])
+            self.assertEqual(len(visited), 6)  # old and new of the 3 containers along the path
+
+
+class TestDocument(TestBase):
+
+    def setUp(self):
+        super(TestDocument, self).setUp()
+        self.document = Document({"items": [{"name": "a", "price": 1}, {"name": "b", "price": 2},
+                                            {"name": "c", "price": 3}], "meta": {"x": 1, "y": 2}})
+
+    def test_views(self):
+        document = self.document
+        names, first, meta = document.view("items.*.name"), document.view("items.0"), document.view("meta.x|z", 0)
+        self.assertEqual((names.value, first.value, meta.value), (["a", "b", "c"], {"name": "a", "price": 1},
+                                                                  {"x": 1}))
+        self.assertIs(names.value, names.value)  # cached
+        document.set_in("items.1.price", 5)
+        self.assertEqual((names.stale, first.stale, meta.stale), (False, False, False))
+        document.set_in("items.1.name", "B")
+        self.assertEqual((names.stale, first.stale, meta.stale), (True, False, False))
+        self.assertEqual(names.value, ["a", "B", "c"])
+        document.set_in("meta.y", 3)
+        self.assertFalse(meta.stale)
+        document.apply_in("meta.z*", str)
+        self.assertTrue(meta.stale)
+        document.set_in(Path("items"), [])
+        self.assertTrue(all(view.stale for view in (names, first)))
+        self.assertEqual(names.value, [])
+
+    def test_indices(self):
+        document = self.document
+        last, middle, sliced = document.view("items.-1.name"), document.view("items.1"), document.view("items.:2")
+        for view in (last, middle, sliced):
+            view.value
+        document.set_in("items.2.name", "C")
+        self.assertEqual((last.stale, middle.stale, sliced.stale), (True, False, False))  # -1 can be 2
+        last.value
+        document.set_in("items.0.name", "A")
+        self.assertEqual((last.stale, middle.stale, sliced.stale), (True, False, True))
+        for view in (last, middle, sliced):
+            view.value
+        document.del_in("items.0")  # the other items move
+        self.assertEqual((last.stale, middle.stale, sliced.stale), (True, True, True))
+        self.assertEqual(middle.value["name"], "C")
+        document.del_in("meta.x")  # not an index
+        self.assertFalse(middle.stale)
+
+    def test_patch(self):
+        document = self.document
+        names, meta = document.view("items.*.name"), document.view("meta")
+        names.value, meta.value
+        document.apply(Patch([("meta.x", "set", 2), ("meta.y", "del")]))
+        self.assertEqual((names.stale, meta.stale), (False, True))
+        self.assertEqual(meta.value, {"x": 2})
+        document.obj["items"][0]["name"] = "A"
+        document.touch("items.0.name")
+        self.assertEqual(names.value, ["A", "b", "c"])
+        document.remove_view(names)
+        self.assertEqual(document.views, [meta])
+
+
+class TestPatternIndex(TestBase):
+
+    def test_match(self):
+        patterns = [WildPath(p) for p in ["a.*.c", "a.b.c", "a.b.*", "a.0|1.c", "a.:2.c", "a.!b.c", "*", "a.b",
+                                          "a.-1.c", "x.y*.z", "a.b.c"]]
+        index = PatternIndex(patterns)
+        self.assertEqual(len(index), len(patterns) - 1)
+        self.assertIn(WildPath("a.b"), index)
+        for path in ["a.b.c", "a.0.c", "a.5.c", "a.b", "a", "x.yy.z", "a.b.c.d", "q"]:
+            self.assertEqual(sorted(index.match(path)), sorted(set(p for p in patterns if p.matches(path))))
+        self.assertEqual(sorted(index.match(Path(("a", 1, "c")))), sorted([WildPath(p) for p in
+                                                                           ["a.*.c", "a.0|1.c", "a.:2.c", "a.!b.c"]]))
+
+    def test_many(self):
+        index = PatternIndex("user%d.*.name|email" % i for i in range(5000))
+        index.add("*.settings.*")
+        self.assertEqual(index.match("user1234.x.name"), [WildPath("user1234.*.name|email")])
+        self.assertEqual(index.match("user1234.settings.theme"), [WildPath("*.settings.*")])
+        self.assertEqual(index.match("user1234.x.y"), [])
+
+
+class TestPatch(TestBase):
+
+    def test_apply(self):
+        obj = {"a": {"b": 1, "c": [1, 2, 3, 4, 5]}, "d": Object(e=2), "f": {"g": 3}}
+        patch = Patch([("a.b", "set", 2), ("a.c.0", "del"), ("a.c.-1", "remove"), ("a.c.2", "delete"),
+                       ("d.e", "change", 3), ("f", "set", {}), ("f.h", "add", 4), ("x", "set", 5)])
+        self.assertIs(patch.apply(obj), obj)
+        self.assertEqual(obj["a"], {"b": 2, "c": [2, 4]})  # indices refer to the positions before the patch
+        self.assertEqual(obj["d"].e, 3)
+        self.assertEqual(obj["f"], {"h": 4})  # sets before the updates deeper in the path
+        self.assertEqual(obj["x"], 5)
+
+    def test_sequential(self):
+        updates = [(Path("routes.0.summary"), "set", "A1"), (Path("routes.0.legs.0.distance.text"), "set", "1 km"),
+                   (WildPath("routes.0.legs.0.steps.*.duration"), "del", None), (Path("status"), "del", None),
+                   (WildPath("routes.0.legs.0.steps.1:3.polyline"), "set", None)]
+        expected = deepcopy(google_route)
+        for path, op, value in updates:
+            if op == "set":
+                path.set_in(expected, value)
+            else:
+                path.del_in(expected)
+        self.assertEqual(Patch(updates).apply(deepcopy(google_route)), expected)
+
+    def test_wild(self):
+        obj = {"l": list(range(10)), "m": {"a": 1, "b": 2, "c": 3}}
+        Patch([("l.1:3", "del"), ("l.0|5", "del"), ("l.-1", "del"), ("m.!a", "del"), ("m.a", "set", 0)]).apply(obj)
+        self.assertEqual(obj, {"l": [3, 4, 6, 7, 8], "m": {"a": 0}})
+
+    def test_updates(self):
+        patch = Patch()
+        patch.set("a.b", 1)
+        patch.set(Path("a.b"), 2)
+        patch.delete("a.c")
+        self.assertEqual(len(patch), 2)
+        self.assertIn(Path("a.b"), patch)
+        self.assertEqual(sorted(patch), [(Path("a.b"), "set", 2), (Path("a.c"), "del", None)])
+        self.assertEqual(patch.apply({"a": {"c": 1}}), {"a": {"b": 2}})
+        with self.assertRaises(ValueError):
+            patch.add("a", "move")
+        with self.assertRaises(ValueError):
+            patch.delete("")
+        with self.assertRaises(IndexError):
+            Patch([("0", "del"), ("2", "del")]).apply([1])
+
+    def test_path_and_wildpath(self):
+        patch = Patch([(Path("a.*"), "set", 1), (WildPath("a.*"), "set", 2), (Path("a.b"), "set", 3),
+                       (WildPath("a.b"), "set", 4)])
+        self.assertEqual(list(patch), [(Path("a.*"), "set", 1), (WildPath("a.*"), "set", 2), (Path("a.b"), "set", 4)])
+        self.assertEqual([type(path) for path, _, _ in patch], [Path, WildPath, WildPath])  # the last update
+        self.assertIn(WildPath("a.*"), patch)
+        document = Document({"a": {"*": 0, "b": 0, "c": 0}})
+        view = document.view("a.c")
+        self.assertEqual(view.value, 0)
+        document.apply(Patch([(Path("a.*"), "set", 1), (WildPath("a.*"), "set", 2)]))
+        self.assertEqual(document.obj, {"a": {"*": 2, "b": 2, "c": 2}})
+        self.assertEqual(view.value, 2)
+
+    def test_single_traversal(self):
+        with self.counting_dict() as (CountingDict, lookups):
+            obj = CountingDict(a=CountingDict(b=CountingDict((str(i), i) for i in range(500))))
+            Patch(("a.b.%d" % i, "set", -i) for i in range(500)).apply(obj)
+            self.assertEqual(lookups, ["a", "b"])
+            self.assertEqual(obj["a"]["b"]["499"], -499)
+
+
+class TestJSONStream(unittest.TestCase):
+
+    def test_iter_json(self):
+        text = json.dumps(google_route, indent=2)
+        for string in ["routes.*.legs.*.steps.*.end_location", "routes.0.legs.0.steps.-1", "status", "",
+                       "routes.0.legs.0.steps.!(::2|-1).distance.value", "routes.0.legs.0.steps.*.*_location.lat",
+                       "routes.*.bounds|overview_polyline", "routes.0.legs.0.steps.1:3|-2:"]:
+            path = WildPath(string)
+            expected = leaves(path.get_in(google_route), path.depth)
+            for chunk_size in [1, 10, 2**16]:
+                items = list(iter_json(io.BytesIO(text.encode("utf-8")), string, chunk_size=chunk_size))
+                self.assertEqual(sorted((v for _, v in items), key=repr), sorted(expected, key=repr))
+                for path, value in items:
+                    self.assertIsInstance(path, Path)
+                    self.assertEqual(path.get_in(google_route), value)
+        self.assertEqual(list(iter_json(text, "routes.0.nothing.*")), [])
+
+    def test_sources(self):
+        text = u'{"a": [1, 2.5, {"b": "\\u00e9]"}], "c": null}'
+        for source in [text, text.encode("utf-8"), io.StringIO(text), io.BytesIO(text.encode("utf-8"))]:
+            self.assertEqual(list(iter_json(source, "a.*")), [(Path("a.0"), 1), (Path("a.1"), 2.5),
+                                                              (Path("a.2"), {"b": u"\u00e9]"})])
+        self.assertEqual(list(iter_json(text, Path("c"))), [(Path("c"), None)])
+        self.assertEqual(list(iter_json(text, "a.2.*|c")), [(Path("a.2.b"), u"\u00e9]")])
+
+    def test_skip(self):
+        text = json.dumps({"skipped": [{"x": "]}" * 10, "y": list(range(100))}] * 100, "found": 1})
+        scanner = JSONScanner(text, chunk_size=16)
+        self.assertEqual(next(scanner.members()), "skipped")
+        scanner.skip()
+        self.assertLess(len(scanner.text), 100)  # skipped text is dropped
+        self.assertEqual(list(iter_json(text, "found", chunk_size=16)), [(Path("found"), 1)])
+        with self.assertRaises(ValueError):
+            list(iter_json(text[:-10], "found"))
+
+    def test_name_patterns_in_arrays(self):
+        obj = {"steps": [{"polyline": ["x"], "a_x": 1}], "b": {"c_x": [2]}}
+        text = json.dumps(obj)
+        for string in ["*.*.*.*_x", "steps.a*", "steps.!a", "*.*_x", "steps.*.*_x", "*.*.!a"]:
+            expected = sorted(WildPath(string).match_items(obj), key=repr)
+            self.assertEqual(sorted(iter_json(text, string), key=repr), expected)
+
+    def test_multibyte_chunks(self):
+        obj = {u"n\u00e4me": [u"\u20ac", {u"k": u"\U0001f600 \u00e9"}], u"z": u"\u00fc"}
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        for string in [u"*.1.k", u"z", u"n\u00e4me.0"]:
+            expected = list(iter_json(data, string))
+            self.assertEqual(len(expected), 1)
+            for chunk_size in [1, 2, 3]:
+                self.assertEqual(list(iter_json(io.BytesIO(data), string, chunk_size=chunk_size)), expected)
+        with self.assertRaises(ValueError):
+            list(iter_json(io.BytesIO(data[:-3]), "z", chunk_size=1))
+
+
+class TestJSONView(unittest.TestCase):
+
+    def setUp(self):
+        self.text = json.dumps(google_route, indent=2).encode("utf-8")
+
+    def test_paths(self):
+        root = JSONDocument(self.text).root
+        self.assertIsInstance(root, JSONObject)
+        self.assertEqual(root, google_route)
+        for string in ["routes.0.legs.0.steps.-1.end_location", "routes.*.legs.*.steps.1:3|-2:.distance.value",
+                       "routes.0.legs.0.steps.!(::2|-1).*_location.lat", "status", "routes.0.bounds.*"]:
+            self.assertEqual(WildPath(string).get_in(root), WildPath(string).get_in(google_route))
+        self.assertEqual(Path("routes.0.legs.0.steps.0.distance.text").get_in(root), "0.1 km")
+        self.assertEqual(dict(Path.items(root)), dict(Path.items(google_route)))
+        with self.assertRaises(KeyError):
+            Path("routes.0.nothing").get_in(root)
+        with self.assertRaises(IndexError):
+            Path("routes.1").get_in(root)
+
+    def test_lazy(self):
+        root = JSONDocument(self.text).root
+        steps = Path("routes.0.legs.0.steps").get_in(root)
+        self.assertIsInstance(steps, JSONArray)
+        self.assertIsNone(steps._index)
+        self.assertEqual(len(steps), 14)
+        self.assertIs(Path("routes.0.legs.0.steps").get_in(root), steps)  # views are kept
+        self.assertEqual(set(root["routes"][0]._views.keys()), {"legs"})
+        self.assertEqual(steps.decode(), google_route["routes"][0]["legs"][0]["steps"])
+        with self.assertRaises(TypeError):
+            Path("routes.0.summary").set_in(root, "x")
+
+    def test_file(self):
+        fd, filename = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(b' {"a": [1, {"b\\"": "\\u00e9"}, -2.5e3, true]} ')
+            with JSONDocument.open(filename) as document:
+                self.assertEqual(document.root, {"a": [1, {'b"': u"\u00e9"}, -2500.0, True]})
+                self.assertEqual(WildPath("a.1.*").get_in(document.root), {'b"': u"\u00e9"})
+        finally:
+            os.remove(filename)
+
+
 class TestDocs(TestBase):
 
     def test_path_example(self):
@@ -0,0 +1,120 @@
+from wildpath.plan import _marker
+
+__author__ = "Lars van Gemerden"
+
+
+def _as_index(key):
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return None
+
+
+class Accessor(object):
+    """
+    Specialized get, set and delete functions for a single Path, generated as python source code and compiled once.
+
+    Keys are inlined as constants and indices are converted to int at generation time. Every step has a fast
+    path for objects of exact type dict, list or tuple; on any other type the generated function falls back to the
+    generic Path code for the rest of the path. 'probe' is used for lookups with a default: missing keys and indices
+    are detected with dict.get and length checks, without raising exceptions.
+    """
+
+    fast_sequence_types = ("list", "tuple")
+
+    def __init__(self, path):
+        self.path = path
+        namespace = {"_marker": _marker}
+        for i in range(max(len(path), 1)):
+            namespace["get_%d" % i] = path[i:]._get_in
+            namespace["probe_%d" % i] = path[i:]._probe_in
+            namespace["set_%d" % i] = path[i:]._set_in
+            namespace["del_%d" % i] = path[i:]._del_in
+        self.source = "\n".join([self._get_source(), self._probe_source(),
+                                 self._set_source("set"), self._set_source("delete")])
+        exec(compile(self.source, "<accessor %s>" % str(path), "exec"), namespace)
+        self.get = namespace["get"]
+        self.probe = namespace["probe"]
+        self.set = namespace["set"]
+        self.delete = namespace["delete"]
+
+    def _lookup_lines(self, i, fallback, indent):
+        key = self.path[i]
+        index = _as_index(key)
+        lines = ["t = type(obj)"]
+        if index is not None:
+            types = " or ".join("t is %s" % t for t in self.fast_sequence_types)
+            lines += ["if %s:" % types,
+                      "    obj = obj[%r]" % index,
+                      "elif t is dict:",
+                      "    obj = obj[%r]" % key]
+        else:
+            lines += ["if t is dict:",
+                      "    obj = obj[%r]" % key]
+        lines += ["else:",
+                  "    return %s" % fallback]
+        return [indent + line for line in lines]
+
+    def _get_source(self):
+        lines = ["def get(obj, default=_marker):"]
+        if len(self.path):
+            lines.append("    try:")
+            for i in range(len(self.path)):
+                lines.extend(self._lookup_lines(i, "get_%d(obj, default)" % i, " " * 8))
+            lines += ["    except (KeyError, IndexError, AttributeError):",
+                      "        if default is _marker:",
+                      "            raise",
+                      "        return default"]
+        lines.append("    return obj")
+        return "\n".join(lines) + "\n"
+
+    def _probe_source(self):
+        """ source code for the 'probe' function: as 'get' with a default, checking keys instead of catching errors """
+        lines = ["def probe(obj, default):"]
+        for i in range(len(self.path)):
+            key = self.path[i]
+            index = _as_index(key)
+            lines.append("    t = type(obj)")
+            if index is not None:
+                types = " or ".join("t is %s" % t for t in self.fast_sequence_types)
+                missing = "len(obj) <= %d" % index if index >= 0 else "len(obj) < %d" % -index
+                lines += ["    if %s:" % types,
+                          "        if %s:" % missing,
+                          "            return default",
+                          "        obj = obj[%r]" % index,
+                          "    elif t is dict:"]
+            else:
+                lines.append("    if t is dict:")
+            lines += ["        obj = obj.get(%r, _marker)" % key,
+                      "        if obj is _marker:",
+                      "            return default",
+                      "    else:",
+                      "        return probe_%d(obj, default)" % i]
+        lines.append("    return obj")
+        return "\n".join(lines) + "\n"
+
+    def _set_source(self, name):
+        """ source code for the 'set' or 'delete' function """
+        prefix = name[:3]
+        args = "obj, value" if name == "set" else "obj"
+        lines = ["def %s(%s):" % (name, args)]
+        if not len(self.path):
+            return "\n".join(lines + ["    return %s_0(%s)" % (prefix, args)]) + "\n"
+        last = len(self.path) - 1
+        for i in range(last):
+            lines.extend(self._lookup_lines(i, "%s_%d(%s)" % (prefix, i, args), " " * 4))
+        key = self.path[last]
+        index = _as_index(key)
+        target = "obj[%r] = value" if name == "set" else "del obj[%r]"
+        lines.append("    t = type(obj)")
+        if index is not None:
+            lines += ["    if t is list:",
+                      "        " + target % index,
+                      "    elif t is dict:",
+                      "        " + target % key]
+        else:
+            lines += ["    if t is dict:",
+                      "        " + target % key]
+        lines += ["    else:",
+                  "        %s_%d(%s)" % (prefix, last, args)]
+        return "\n".join(lines) + "\n"
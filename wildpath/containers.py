@@ -0,0 +1,383 @@
+from collections import Mapping, Sequence, MutableMapping, MutableSequence
+from copy import copy as shallow_copy
+from heapq import merge
+from inspect import getmro, isroutine
+from itertools import compress
+
+from wildpath.indexsets import IndexSet
+
+__author__ = "Lars van Gemerden"
+
+
+MAPPING, SEQUENCE, OBJECT = "mapping", "sequence", "object"  # kinds of handlers
+
+try:
+    value_sequence_types = (basestring, bytearray, bytes, buffer)
+except NameError:
+    value_sequence_types = (str, bytearray, bytes)
+
+
+def _is_dunder(name):
+    return name.startswith("__") and name.endswith("__")
+
+
+class ClassSchema(object):
+    """
+    The attribute names of a class, as used for iterating over and matching attributes of its instances, determined
+    once per class (see schema_for()):
+
+     - names: the sorted (as by dir()) names of the class attributes, excluding names starting and ending with '__',
+     - properties: names of non-callable descriptors (e.g. properties, __slots__ members), included in items,
+     - methods: names of callable class attributes, only included in items to call (see WildPath.call_in),
+     - routines: names of functions, static- and classmethods in the class; their values are always callable.
+    """
+
+    def __init__(self, cls):
+        self.signature = _signature(cls)
+        self.names = [name for name in dir(cls) if not _is_dunder(name)]
+        self.name_set = set(self.names)
+        self._names = {}  # layout of the instance __dict__ -> names
+        self.properties, self.methods, self.routines = set(), set(), set()
+        for name in self.names:
+            for base in getmro(cls):
+                if name in vars(base):
+                    raw = vars(base)[name]
+                    if isroutine(raw) or isinstance(raw, (staticmethod, classmethod)):
+                        self.routines.add(name)
+                    break
+            attr = getattr(cls, name, None)
+            if callable(attr):
+                self.methods.add(name)
+            elif isinstance(attr, property) or hasattr(attr, "__get__") or hasattr(attr, "__set__"):
+                self.properties.add(name)
+        self.custom_dir = getattr(cls, "__dir__", None) is not getattr(object, "__dir__", None)
+
+    def names_of(self, instance_dict):
+        """ the names dir(obj) would return, without the '__' names; 'instance_dict' is obj.__dict__ (if any) """
+        if not instance_dict:  # e.g. __slots__ classes
+            return self.names
+        layout = tuple(instance_dict)  # instances of a class mostly have the same attributes, in the same order
+        names = self._names.get(layout)
+        if names is None:
+            extra = sorted(k for k in layout if k not in self.name_set and not _is_dunder(k))
+            names = list(merge(self.names, extra)) if extra else self.names
+            if len(self._names) < 64:
+                self._names[layout] = names
+        return names
+
+
+def _signature(cls):
+    """ changes when attributes are added to or removed from the class or one of its bases """
+    return tuple(map(len, map(vars, getattr(cls, "__mro__", None) or getmro(cls))))
+
+
+_schemas = {}  # class -> ClassSchema
+
+
+def schema_for(cls):
+    """
+    Returns the (cached) ClassSchema of 'cls'. The schema is recreated when attributes are added to or removed from
+    the class (or a base class); after replacing the value of a class attribute with a different kind of attribute
+    (e.g. a method with a property), call clear_cache().
+    """
+    schema = _schemas.get(cls)
+    if schema is None or schema.signature != _signature(cls):
+        schema = _schemas[cls] = ClassSchema(cls)
+    return schema
+
+
+def get_object_dict(obj):
+    schema = schema_for(obj.__class__)
+    if schema.custom_dir:
+        return {name: getattr(obj, name) for name in dir(obj) if not _is_dunder(name)
+                and not callable(getattr(obj, name))}
+    instance_dict = getattr(obj, "__dict__", None)
+    result = {}
+    for name in schema.names_of(instance_dict):
+        if name in schema.routines and not (instance_dict and name in instance_dict):
+            continue
+        attr = getattr(obj, name)
+        if not callable(attr):
+            result[name] = attr
+    return result
+
+
+def _dir_object_items(obj, _call=False):
+    """ for classes with a custom __dir__ """
+    for name in dir(obj):
+        if not _is_dunder(name):
+            attr = getattr(obj, name)
+            if name in obj.__dict__ or (_call and callable(attr)):
+                yield name, attr
+            else:
+                cls_attr = getattr(obj.__class__, name, None)
+                if not callable(cls_attr):
+                    if (isinstance(cls_attr, property) or
+                            hasattr(cls_attr, "__get__") or
+                            hasattr(cls_attr, "__set__")):
+                        yield name, attr
+
+
+def get_object_items(obj, _call=False):
+    schema = schema_for(obj.__class__)
+    if schema.custom_dir:
+        return _dir_object_items(obj, _call)
+    return _schema_object_items(obj, schema, _call)
+
+
+def _schema_object_items(obj, schema, _call):
+    instance_dict = getattr(obj, "__dict__", None) or {}
+    for name in schema.names_of(instance_dict):
+        if name in instance_dict or name in schema.properties:
+            yield name, getattr(obj, name)
+        elif _call and name in schema.methods:
+            attr = getattr(obj, name)
+            if callable(attr):
+                yield name, attr
+
+
+class Handler(object):
+    """
+    Base class for handlers: a handler implements lookup, update and iteration for one kind of object (mappings,
+    sequences or objects with attributes). Subclass it to let paths traverse custom container types, see register().
+
+     - kind: one of MAPPING, SEQUENCE or OBJECT, e.g. determines how values in WildPath.set_in are looked up,
+     - indexed: if True, keys are int indices,
+     - leaf: if True, the iterators (Path.items(obj), ...) do not iterate into the object.
+    """
+
+    kind = None
+    indexed = False
+
+    def __init__(self, leaf=False):
+        self.leaf = leaf
+
+    def get(self, obj, key):
+        raise NotImplementedError
+
+    def probe(self, obj, key, default=None):
+        """ returns the value for 'key' or 'default' if it is missing; override to avoid raising and catching """
+        try:
+            return self.get(obj, key)
+        except (KeyError, IndexError, AttributeError):
+            return default
+
+    def set(self, obj, key, value):
+        raise NotImplementedError
+
+    def delete(self, obj, key):
+        raise NotImplementedError
+
+    def delete_keys(self, obj, keys):
+        for key in keys:
+            self.delete(obj, key)
+
+    def contains(self, obj, key):
+        return key in self.keys(obj)
+
+    def keys(self, obj):
+        """ returns the keys (or indices) wild keys are matched against """
+        raise NotImplementedError
+
+    def items(self, obj, _call=False):
+        """ iterates over the (key, value) pairs the iterators (Path.items(obj), ...) iterate into """
+        raise NotImplementedError
+
+    def new(self, obj, items):
+        """ creates the result of a wildpath lookup from (key, value) pairs selected in 'obj' """
+        raise NotImplementedError
+
+    def copy(self, obj):
+        """ returns a shallow copy of 'obj', used by the copy-on-write updates (e.g. path.set_in(obj, value, copy=True)) """
+        return shallow_copy(obj)
+
+
+class MappingHandler(Handler):
+
+    kind = MAPPING
+
+    def get(self, obj, key):
+        return obj[key]
+
+    def probe(self, obj, key, default=None):
+        if type(obj) is dict:  # not for subclasses, e.g. defaultdict creates missing values
+            return obj.get(key, default)
+        return super(MappingHandler, self).probe(obj, key, default)
+
+    def set(self, obj, key, value):
+        obj[key] = value
+
+    def delete(self, obj, key):
+        del obj[key]
+
+    def keys(self, obj):
+        return obj
+
+    def items(self, obj, _call=False):
+        return obj.items()
+
+    def new(self, obj, items):
+        return obj.__class__(items)
+
+
+class SequenceHandler(Handler):
+
+    kind = SEQUENCE
+    indexed = True
+
+    def get(self, obj, index):
+        return obj[index]
+
+    def probe(self, obj, index, default=None):
+        if -len(obj) <= index < len(obj):
+            return self.get(obj, index)
+        return default
+
+    def set(self, obj, index, value):
+        obj[index] = value
+
+    def delete(self, obj, index):
+        del obj[index]
+
+    def delete_keys(self, obj, indices):
+        if isinstance(indices, IndexSet):
+            slices = indices.slices()
+            if slices is not None:
+                for slc in reversed(slices):
+                    del obj[slc]
+            else:
+                obj[:] = list(compress(obj, (~indices).bitmap()))
+            return
+        for i in indices:
+            obj[i] = _deleted  # marked for deletion
+        obj[:] = [v for v in obj if v is not _deleted]
+
+    def contains(self, obj, index):
+        return -len(obj) <= index < len(obj)
+
+    def keys(self, obj):
+        return range(len(obj))
+
+    def items(self, obj, _call=False):
+        return enumerate(obj)
+
+    def new(self, obj, items):
+        return obj.__class__(v for _, v in items)
+
+
+class ObjectHandler(Handler):
+
+    kind = OBJECT
+
+    def get(self, obj, key):
+        return getattr(obj, key)
+
+    def probe(self, obj, key, default=None):
+        return getattr(obj, key, default)
+
+    def set(self, obj, key, value):
+        setattr(obj, key, value)
+
+    def delete(self, obj, key):
+        delattr(obj, key)
+
+    def contains(self, obj, key):
+        """ consistent with keys(): attributes that are not callable and do not start and end with '__' """
+        if key.startswith("__") and key.endswith("__"):
+            return False
+        attr = getattr(obj, key, _deleted)
+        return attr is not _deleted and not callable(attr)
+
+    def keys(self, obj):
+        return get_object_dict(obj)
+
+    def items(self, obj, _call=False):
+        return get_object_items(obj, _call)
+
+    def new(self, obj, items):
+        return dict(items)
+
+
+class _FrozenMixin(object):
+    """ immutable containers: setting and deleting falls back to attribute access (as for other objects) """
+
+    def set(self, obj, key, value):
+        setattr(obj, str(key), value)
+
+    def delete(self, obj, key):
+        delattr(obj, str(key))
+
+    def delete_keys(self, obj, keys):
+        for key in keys:
+            self.delete(obj, key)
+
+
+class FrozenMappingHandler(_FrozenMixin, MappingHandler):
+    pass
+
+
+class FrozenSequenceHandler(_FrozenMixin, SequenceHandler):
+    pass
+
+
+_deleted = object()
+
+mapping_handler = MappingHandler()
+frozen_mapping_handler = FrozenMappingHandler()
+sequence_handler = SequenceHandler()
+frozen_sequence_handler = FrozenSequenceHandler()
+object_handler = ObjectHandler()
+attribute_handler = ObjectHandler(leaf=True)  # objects without __dict__: attributes can be accessed, not iterated over
+value_handler = SequenceHandler(leaf=True)  # e.g. bytearray: indices can be accessed, not iterated over
+frozen_value_handler = FrozenSequenceHandler(leaf=True)  # e.g. str
+
+_registered = []  # (cls, handler), most recently registered first
+_handlers = {}  # cache: type(obj) -> handler
+
+
+def register(cls, handler):
+    """ registers a handler for instances of 'cls' (and subclasses); takes precedence over the built-in handlers """
+    _registered.insert(0, (cls, handler))
+    _handlers.clear()
+
+
+def unregister(cls):
+    _registered[:] = [(c, h) for c, h in _registered if c is not cls]
+    _handlers.clear()
+
+
+def clear_cache():
+    """
+    The handler and the attribute schema are cached per type; clear the caches e.g. after registering a class with one
+    of the ABC's or after changing class attributes.
+    """
+    _handlers.clear()
+    _schemas.clear()
+
+
+def _classify(obj):
+    for cls, handler in _registered:
+        if isinstance(obj, cls):
+            return handler
+    if isinstance(obj, value_sequence_types):
+        return value_handler if isinstance(obj, MutableSequence) else frozen_value_handler
+    if isinstance(obj, MutableMapping):
+        return mapping_handler
+    if isinstance(obj, Mapping):
+        return frozen_mapping_handler
+    if isinstance(obj, MutableSequence):
+        return sequence_handler
+    if isinstance(obj, Sequence):
+        return frozen_sequence_handler
+    if hasattr(obj, "__dict__"):
+        return object_handler
+    return attribute_handler
+
+
+def handler_for(obj, _handlers=_handlers):
+    """ returns the handler for 'obj', classification is done once per type """
+    try:
+        return _handlers[type(obj)]
+    except KeyError:
+        handler = _handlers[type(obj)] = _classify(obj)
+        return handler
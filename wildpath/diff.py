@@ -0,0 +1,69 @@
+"""
+Structural differences between two (versions of a) nested objects, as changes that can be applied with set_in and
+del_in or with a Patch.
+"""
+from collections import namedtuple
+
+from wildpath.containers import handler_for
+from wildpath.paths import Path
+
+__author__ = "Lars van Gemerden"
+
+
+ADD, REMOVE, CHANGE = "add", "remove", "change"
+
+Change = namedtuple("Change", ["path", "op", "value"])  # value is None for REMOVE
+
+_missing = object()
+
+
+def _compared_by_item(old, new):
+    """ returns the handler if 'old' and 'new' are compared item by item, None if they are compared as values """
+    if type(old) is not type(new):
+        return None
+    handler = handler_for(old)
+    return None if handler.leaf else handler
+
+
+def diff(old, new):
+    """
+    Iterates over the changes that turn 'old' into 'new', as Change(path, op, value) tuples with op ADD, REMOVE or
+    CHANGE. Sub-objects that are the same object in 'old' and 'new' are skipped without looking into them, so for
+    versions that share unchanged parts (see set_in(..., copy=True)) the cost depends on the size of the changes, not
+    on the size of the objects. Sequences of different lengths and objects of different types are changed as a whole;
+    if 'old' and 'new' differ as a whole (e.g. diff(1, [1])), the only change is a CHANGE with an empty path: 'new'
+    replaces the object itself.
+
+    The changes can be applied in the order they are yielded, with 'path.set_in(obj, value)' for ADD and CHANGE and
+    'path.del_in(obj)' for REMOVE (a change with an empty path cannot be applied in place), or all at once with
+    'obj = Patch(diff(old, new)).apply(obj)'.
+    """
+    stack = [((), old, new)]
+    while stack:
+        keys, old, new = stack.pop()
+        if old is new:
+            continue
+        handler = _compared_by_item(old, new)
+        if handler is None:
+            if old != new:
+                yield Change(Path(keys), CHANGE, new)
+            continue
+        subs = []
+        if handler.indexed:
+            if len(old) != len(new):
+                yield Change(Path(keys), CHANGE, new)
+                continue
+            for (i, old_value), (_, new_value) in zip(handler.items(old), handler.items(new)):
+                if old_value is not new_value:
+                    subs.append((keys + (str(i),), old_value, new_value))
+        else:
+            old_items = dict(handler.items(old))
+            for key, new_value in handler.items(new):
+                old_value = old_items.pop(key, _missing)
+                if old_value is _missing:
+                    yield Change(Path(keys + (key,)), ADD, new_value)
+                elif old_value is not new_value:
+                    subs.append((keys + (key,), old_value, new_value))
+            for key in old_items:
+                yield Change(Path(keys + (key,)), REMOVE, None)
+        stack.extend(reversed(subs))
@@ -0,0 +1,145 @@
+"""
+Documents with views: the results of (Wild)Path lookups in an object, cached until a change in the object can affect
+them. Changes are made through the document (or reported with Document.touch()), so only the affected views are
+recomputed.
+"""
+from wildpath.patch import DEL
+from wildpath.paths import WildPath
+from wildpath.plan import WildStep, make_step, _marker
+
+__author__ = "Lars van Gemerden"
+
+
+def _steps(path):
+    if isinstance(path, WildPath):
+        return list(path.compile())
+    return [make_step(key) for key in path]
+
+
+def _literals_overlap(step, other):
+    """ for two literal steps: whether they can select the same item (e.g. "0" and "-1" in a sequence of length 1) """
+    if step.key == other.key:
+        return True
+    if step.index is None or other.index is None:
+        return False
+    return step.index < 0 or other.index < 0 or step.index == other.index
+
+
+def _wild_overlaps(wild, step):
+    """ whether a wild and a literal step can select the same item """
+    if wild.matches(step.key):
+        return True
+    if step.index is None:
+        return False
+    if step.index < 0 or not wild.length_independent:
+        return True
+    return step.index in wild.expression.select_indices(step.index + 1)
+
+
+def _steps_overlap(step, other):
+    """ whether two steps can select the same item; True if this cannot be determined from the steps """
+    wild, other_wild = isinstance(step, WildStep), isinstance(other, WildStep)
+    if not (wild or other_wild):
+        return _literals_overlap(step, other)
+    if wild and other_wild:
+        if step.literals is None or other.literals is None:
+            return True
+        return any(_literals_overlap(make_step(key), make_step(other_key))
+                   for key in step.literals for other_key in other.literals)
+    return _wild_overlaps(step, other) if wild else _wild_overlaps(other, step)
+
+
+def overlap(steps, other_steps):
+    """ whether the paths of the steps can reach the same item, or one of them an item inside the other """
+    return all(_steps_overlap(step, other) for step, other in zip(steps, other_steps))
+
+
+class View(object):
+    """ the result of a (Wild)Path lookup in the object of a document, see Document.view() """
+
+    def __init__(self, document, path, default=_marker):
+        self.document = document
+        self.path = path
+        self.default = default
+        self.steps = _steps(path)
+        self.stale = True
+        self._value = None
+
+    @property
+    def value(self):
+        """ the cached result, recomputed if a change in the document can have affected it """
+        if self.stale:
+            self._value = self.path.get_in(self.document.obj, self.default)
+            self.stale = False
+        return self._value
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, str(self.path))
+
+
+class Document(object):
+    """
+    Wraps an object to keep views of it up to date. Changes made with the methods of the document mark the views they
+    can affect as stale; unaffected views keep their cached result. Changes made to the object in another way must be
+    reported with touch().
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.views = []
+
+    @staticmethod
+    def _path(path):
+        return WildPath(path) if isinstance(path, str) else path
+
+    def view(self, path, default=_marker):
+        """ creates and returns a view of the result of path.get_in(self.obj, default) """
+        view = View(self, self._path(path), default)
+        self.views.append(view)
+        return view
+
+    def remove_view(self, view):
+        self.views.remove(view)
+
+    def touch(self, path, deleted=False):
+        """
+        Marks the views that a change at 'path' can affect as stale. With deleted=True, the item(s) at 'path' were
+        deleted; in a sequence this moves the items after them, so views of any item in the container are affected
+        (unless the last key of 'path' is not an index).
+        """
+        steps = _steps(self._path(path))
+        if deleted and steps and (isinstance(steps[-1], WildStep) or steps[-1].index is not None):
+            steps = steps[:-1]
+        for view in self.views:
+            if not view.stale and overlap(steps, view.steps):
+                view.stale = True
+
+    def get_in(self, path, default=_marker):
+        return self._path(path).get_in(self.obj, default)
+
+    def set_in(self, path, value):
+        path = self._path(path)
+        path.set_in(self.obj, value)
+        self.touch(path)
+
+    def del_in(self, path):
+        path = self._path(path)
+        path.del_in(self.obj)
+        self.touch(path, deleted=True)
+
+    def pop_in(self, path):
+        path = self._path(path)
+        result = path.pop_in(self.obj)
+        self.touch(path, deleted=True)
+        return result
+
+    def apply_in(self, path, func):
+        path = self._path(path)
+        path.apply_in(self.obj, func)
+        self.touch(path)
+
+    def apply(self, patch):
+        """ applies a Patch to the object (which the patch can replace, see Patch.apply()) """
+        self.obj = patch.apply(self.obj)
+        for path, op, _ in patch:
+            self.touch(path, deleted=op == DEL)
@@ -0,0 +1,279 @@
+"""
+Sets of indices into a sequence of given length, used to evaluate index expressions like "1:3|-1" or "!::2".
+
+Index sets are kept symbolic as long as possible (intervals, arithmetic progressions), so the cost of evaluating an
+expression depends on the number of selected indices, not on the length of the sequence. Iterating over an index set
+yields the indices in ascending (sequence) order.
+"""
+from bisect import bisect_right
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+__author__ = "Lars van Gemerden"
+
+
+class IndexSet(object):
+    """ baseclass of sets of indices in range(length) """
+
+    def __init__(self, length):
+        self.length = length
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, index):
+        raise NotImplementedError
+
+    def slices(self):
+        """ returns a list of ascending slice objects covering the set, or None if the set has no such form """
+        return None
+
+    def bitmap(self):
+        """ returns a bytearray of length self.length, with a 1 at every index in the set and 0 elsewhere """
+        bits = bytearray(self.length)
+        slices = self.slices()
+        if slices is None:
+            for i in self:
+                bits[i] = 1
+        else:
+            for slc in slices:
+                bits[slc] = b"\x01" * len(range(*slc.indices(self.length)))
+        return bits
+
+    def __and__(self, other):
+        return Bitmap(self.length, _from_int(_to_int(self.bitmap()) & _to_int(other.bitmap()), self.length))
+
+    def __or__(self, other):
+        return Bitmap(self.length, _from_int(_to_int(self.bitmap()) | _to_int(other.bitmap()), self.length))
+
+    def __invert__(self):
+        return Bitmap(self.length, self.bitmap().translate(_INVERT))
+
+    def __eq__(self, other):
+        return isinstance(other, IndexSet) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+class Intervals(IndexSet):
+    """ a sorted list of disjoint, non-adjacent (start, stop) intervals """
+
+    def __init__(self, length, intervals=()):
+        super(Intervals, self).__init__(length)
+        self.intervals = self._merged(intervals)
+        self._starts = [start for start, _ in self.intervals]
+
+    @staticmethod
+    def _merged(intervals):
+        merged = []
+        for start, stop in sorted(intervals):
+            if start >= stop:
+                continue
+            if merged and start <= merged[-1][1]:
+                if stop > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], stop)
+            else:
+                merged.append((start, stop))
+        return merged
+
+    def __iter__(self):
+        for start, stop in self.intervals:
+            for i in range(start, stop):
+                yield i
+
+    def __len__(self):
+        return sum(stop - start for start, stop in self.intervals)
+
+    def __contains__(self, index):
+        k = bisect_right(self._starts, index) - 1
+        return k >= 0 and index < self.intervals[k][1]
+
+    def slices(self):
+        return [slice(start, stop) for start, stop in self.intervals]
+
+    def __and__(self, other):
+        if isinstance(other, Intervals):
+            result, a, b = [], self.intervals, other.intervals
+            i = j = 0
+            while i < len(a) and j < len(b):
+                start, stop = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+                if start < stop:
+                    result.append((start, stop))
+                if a[i][1] < b[j][1]:
+                    i += 1
+                else:
+                    j += 1
+            return Intervals(self.length, result)
+        if isinstance(other, Progression):
+            return other & self
+        return super(Intervals, self).__and__(other)
+
+    def __or__(self, other):
+        if isinstance(other, Intervals):
+            return Intervals(self.length, self.intervals + other.intervals)
+        if not len(other):
+            return self
+        return super(Intervals, self).__or__(other)
+
+    def __invert__(self):
+        gaps, start = [], 0
+        for a, b in self.intervals:
+            gaps.append((start, a))
+            start = b
+        gaps.append((start, self.length))
+        return Intervals(self.length, gaps)
+
+
+def _inverse(a, m):
+    """ modular inverse of a (mod m), a and m co-prime """
+    r0, r1, s0, s1 = a % m, m, 1, 0
+    while r1:
+        q = r0 // r1
+        r0, r1, s0, s1 = r1, r0 - q * r1, s1, s0 - q * s1
+    return s0 % m
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+class Progression(IndexSet):
+    """ indices start, start + step, ... < stop, with step > 1 """
+
+    def __init__(self, length, start, stop, step):
+        super(Progression, self).__init__(length)
+        self.start, self.stop, self.step = start, max(start, stop), step
+
+    @property
+    def range(self):
+        return range(self.start, self.stop, self.step)
+
+    def __iter__(self):
+        return iter(self.range)
+
+    def __len__(self):
+        return len(self.range)
+
+    def __contains__(self, index):
+        return self.start <= index < self.stop and (index - self.start) % self.step == 0
+
+    def slices(self):
+        return [slice(self.start, self.stop, self.step)]
+
+    def _clipped(self, start, stop):
+        """ the elements in [start, stop) """
+        if start > self.start:
+            start = self.start + -(-(start - self.start) // self.step) * self.step
+        else:
+            start = self.start
+        return Progression(self.length, start, min(stop, self.stop), self.step)
+
+    def __and__(self, other):
+        if isinstance(other, Intervals):
+            if not other.intervals:
+                return other
+            if len(other.intervals) == 1:
+                return self._clipped(*other.intervals[0])
+        elif isinstance(other, Progression):
+            # solve x = self.start (mod self.step) and x = other.start (mod other.step): chinese remainder theorem
+            g = _gcd(self.step, other.step)
+            if (other.start - self.start) % g:
+                return Intervals(self.length)
+            step = self.step // g * other.step
+            k = (other.start - self.start) // g * _inverse(self.step // g, other.step // g) % (other.step // g)
+            start = self.start + k * self.step
+            progression = Progression(self.length, start % step, self.length, step)
+            return progression._clipped(max(self.start, other.start), min(self.stop, other.stop))
+        return super(Progression, self).__and__(other)
+
+
+_INVERT = bytearray(range(256))
+_INVERT[0], _INVERT[1] = 1, 0
+_INVERT = bytes(_INVERT)
+
+try:
+    int.from_bytes
+
+    def _to_int(bits):
+        return int.from_bytes(bits, "big")
+
+    def _from_int(n, length):
+        return bytearray(n.to_bytes(length, "big"))
+
+except AttributeError:  # python 2
+    from binascii import hexlify, unhexlify
+
+    def _to_int(bits):
+        return int(hexlify(bits), 16) if bits else 0
+
+    def _from_int(n, length):
+        return bytearray(unhexlify(("%x" % n).rjust(2 * length, "0")))
+
+
+class Bitmap(IndexSet):
+    """
+    Index set as a bytearray with a 1 for every index in the set (1 byte per index in the sequence). '&' and '|' are
+    done on the bitmaps as (large) integers, '!' by bytearray.translate and iteration by bytearray.find, so all
+    operations are linear with a small constant. Fallback for sets that are not intervals or a single progression.
+    """
+
+    def __init__(self, length, bits=None):
+        super(Bitmap, self).__init__(length)
+        self.bits = bytearray(length) if bits is None else bits
+
+    @classmethod
+    def from_indices(cls, length, indices):
+        bits = bytearray(length)
+        for i in indices:
+            bits[i] = 1
+        return cls(length, bits)
+
+    def bitmap(self):
+        return self.bits
+
+    def __iter__(self):
+        bits, i = self.bits, -1
+        while True:
+            i = bits.find(b"\x01", i + 1)
+            if i < 0:
+                return
+            yield i
+
+    def __len__(self):
+        return self.bits.count(b"\x01")
+
+    def __contains__(self, index):
+        return 0 <= index < self.length and self.bits[index] == 1
+
+
+def from_slice(length, slc):
+    start, stop, step = slc.indices(length)
+    indices = range(start, stop, step)
+    if not len(indices):
+        return Intervals(length)
+    first, last = min(indices[0], indices[-1]), max(indices[0], indices[-1])
+    if abs(step) == 1:
+        return Intervals(length, [(first, last + 1)])
+    return Progression(length, first, last + 1, abs(step))
+
+
+def from_index(length, index):
+    if index < 0:
+        index += length
+    return Intervals(length, [(index, index + 1)] if 0 <= index < length else [])
+
+
+def full(length):
+    return Intervals(length, [(0, length)])
@@ -0,0 +1,298 @@
+"""
+Evaluation of a (Wild)Path on JSON text that is read incrementally (from a file, bytes or str), without loading the
+document: only the values at the end of the path are decoded, other parts of the document are skipped over.
+"""
+import io
+import re
+from codecs import getincrementaldecoder
+from json import JSONDecoder
+from json.decoder import scanstring
+
+from wildpath.paths import Path, WildPath
+from wildpath.plan import WildStep, make_step
+
+__author__ = "Lars van Gemerden"
+
+
+_WS = re.compile(r"[ \t\n\r]*")
+_WHITESPACE = u" \t\n\r"
+_DELIMITERS = u",:]}" + _WHITESPACE
+_STRUCTURE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|(?P<open>[\[{])|(?P<close>[\]}])|(?P<incomplete>")')
+
+
+def scan_structure(text, i, depth, structure=_STRUCTURE):
+    """
+    Scans JSON 'text' (str, or bytes with a bytes version of the 'structure' pattern) from position 'i', inside an
+    object or array at nesting 'depth' (0 before the opening bracket). Returns (position, depth): with depth 0 the
+    position is just after the closing bracket, otherwise the scan can be continued from that position when more text is
+    available (e.g. the text ends in the middle of a string).
+    """
+    for match in structure.finditer(text, i):
+        group = match.lastgroup
+        if group == "open":
+            depth += 1
+        elif group == "close":
+            depth -= 1
+            if not depth:
+                return match.end(), 0
+        elif group == "incomplete":
+            return match.start(), depth
+    return len(text), depth
+
+
+class JSONScanner(object):
+    """
+    Reads JSON text in chunks. 'text' holds the part of the input that is read and not yet consumed, 'pos' is the
+    current position in 'text'. Already consumed text is dropped when the next chunk is read, unless the scanner is
+    pinned (see pin()), so positions in pinned text remain valid.
+    """
+
+    decoder = JSONDecoder()
+
+    def __init__(self, source, chunk_size=2**16):
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        elif isinstance(source, type(u"")):
+            source = io.StringIO(source)
+        self.read = source.read
+        self.chunk_size = chunk_size
+        self.text = u""
+        self.pos = 0
+        self.eof = False
+        self.pins = 0
+        self._decode = getincrementaldecoder("utf-8")().decode
+
+    def more(self):
+        """ reads the next chunk; returns False at the end of the input """
+        if self.eof:
+            return False
+        chunk = self.read(max(self.chunk_size, len(self.text) - self.pos))  # grows geometrically for large values
+        if not chunk:
+            self.eof = True
+            if not isinstance(chunk, type(u"")):
+                self._decode(chunk, True)  # raises if the input ends in an incomplete character
+            return False
+        if not isinstance(chunk, type(u"")):
+            chunk = self._decode(chunk)  # can be empty: a part of a multi-byte character
+        if self.pins:
+            self.text += chunk
+        else:
+            self.text = self.text[self.pos:] + chunk
+            self.pos = 0
+        return True
+
+    def pin(self):
+        self.pins += 1
+
+    def unpin(self):
+        self.pins -= 1
+
+    def peek(self):
+        """ skips whitespace and returns the next character, or "" at the end of the input """
+        char = self.text[self.pos:self.pos + 1]
+        if char and char not in _WHITESPACE:
+            return char
+        while True:
+            self.pos = _WS.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return u""
+
+    def expect(self, chars):
+        """ consumes the next character, which must be one of 'chars' """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("expected one of %r at position %d, found %r" % (chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ decodes and consumes the value at the current position """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.more():
+                    continue  # the value is not complete yet
+                raise
+            if (end < len(self.text) and self.text[end] in _DELIMITERS) or not self.more():
+                self.pos = end  # e.g. a number can continue in the next chunk
+                return value
+
+    def key(self):
+        """ decodes and consumes the (string) key of an object member, including the ':' """
+        self.expect(u'"')
+        while True:
+            try:
+                key, end = scanstring(self.text, self.pos)
+            except ValueError:
+                if self.more():
+                    continue
+                raise
+            self.pos = end
+            self.expect(u":")
+            return key
+
+    def skip(self):
+        """ consumes the value at the current position; objects and arrays are skipped without decoding them """
+        if self.peek() not in u"[{":
+            self.decode()
+            return
+        i, depth = scan_structure(self.text, self.pos, 0)
+        while depth:
+            if not self.pins:
+                self.pos = i  # the skipped text is not needed anymore
+            offset = i - self.pos
+            if not self.more():
+                raise ValueError("unexpected end of JSON input")
+            i, depth = scan_structure(self.text, self.pos + offset, depth)
+        self.pos = i
+
+    def members(self):
+        """ iterates over the keys of the object at the current position; the value must be consumed for every key """
+        self.expect(u"{")
+        if self.peek() == u"}":
+            self.pos += 1
+            return
+        while True:
+            yield self.key()
+            if self.expect(u",}") == u"}":
+                return
+
+    def elements(self):
+        """ iterates over the indices of the array at the current position; the value must be consumed for each index """
+        self.expect(u"[")
+        if self.peek() == u"]":
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            if self.expect(u",]") == u"]":
+                return
+            index += 1
+
+
+class _IndexMatcher(object):
+    """ matches indices of a sequence of unknown length, for expressions that do not depend on the length """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.length = 0
+        self.indices = None
+
+    def __call__(self, index):
+        if index >= self.length:
+            self.length = 2 * index + 16
+            self.indices = self.expression.select_indices(self.length)
+        return index in self.indices
+
+
+def _index_matcher(step):
+    """ returns a function index -> bool for 'step', or None if the selected indices depend on the length """
+    if isinstance(step, WildStep):
+        if step.length_independent:
+            return _IndexMatcher(step.expression)
+        try:
+            step.expression.select_indices(0)
+        except ValueError:  # e.g. "a*" or "!a": the step does not select indices (as in WildStep.items)
+            return lambda index: False
+        return None
+    if step.index is None:
+        return lambda index: False
+    if step.index >= 0:
+        return step.index.__eq__
+    return None
+
+
+class JSONStream(object):
+    """
+    Evaluates a path on the JSON text read by a JSONScanner; see iter_json().
+    """
+
+    def __init__(self, scanner, path):
+        self.scanner = scanner
+        if isinstance(path, WildPath):
+            self.steps = path.compile()
+        else:
+            self.steps = [make_step(key) for key in path]
+
+    def items(self):
+        for keys, value in self._value(0, ()):
+            yield Path(keys), value
+
+    def _value(self, i, keys):
+        scanner = self.scanner
+        if i == len(self.steps):
+            yield keys, scanner.decode()
+            return
+        char = scanner.peek()
+        if char == u"{":
+            items = self._object(i, keys)
+        elif char == u"[":
+            items = self._array(i, keys)
+        else:
+            scanner.skip()
+            return
+        for item in items:
+            yield item
+
+    def _object(self, i, keys):
+        step, scanner = self.steps[i], self.scanner
+        for key in scanner.members():
+            if step.matches(key):
+                for item in self._value(i + 1, keys + (key,)):
+                    yield item
+            else:
+                scanner.skip()
+
+    def _array(self, i, keys):
+        step, scanner = self.steps[i], self.scanner
+        match = _index_matcher(step)
+        if match is None:
+            for item in self._selected_elements(i, keys):
+                yield item
+            return
+        for index in scanner.elements():
+            if match(index):
+                for item in self._value(i + 1, keys + (str(index),)):
+                    yield item
+            else:
+                scanner.skip()
+
+    def _selected_elements(self, i, keys):
+        """ the selection depends on the length of the array: the array is scanned first, keeping the text """
+        step, scanner = self.steps[i], self.scanner
+        scanner.pin()
+        try:
+            starts = []
+            for _ in scanner.elements():
+                starts.append(scanner.pos)
+                scanner.skip()
+            end = scanner.pos
+            if isinstance(step, WildStep):
+                selected = step.expression.select_indices(len(starts))
+            else:
+                index = step.index + len(starts) if step.index < 0 else step.index
+                selected = [index] if 0 <= index < len(starts) else []
+            for index in selected:
+                scanner.pos = starts[index]
+                for item in self._value(i + 1, keys + (str(index),)):
+                    yield item
+            scanner.pos = end
+        finally:
+            scanner.unpin()
+
+
+def iter_json(source, path, chunk_size=2**16):
+    """
+    Iterates over the (Path, value) items in the JSON document 'source' (a file opened in text or binary mode, bytes
+    or str) at (Wild)Path 'path', in document order. Only these values are decoded, the rest of the document is
+    skipped over, and the document is read in chunks of (at least) 'chunk_size', so memory use does not depend on the
+    size of the document. Note that JSON strings are values: unlike in WildPath.get_in, paths do not continue into them.
+    """
+    if isinstance(path, str):
+        path = WildPath(path)
+    return JSONStream(JSONScanner(source, chunk_size), path).items()
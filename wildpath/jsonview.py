@@ -0,0 +1,237 @@
+"""
+Read-only, lazy views of JSON documents in (memory mapped) files. Objects and arrays in the document are indexed (the
+offsets of their keys and items) when they are first accessed and values are only decoded when they are looked up,
+so paths can traverse large documents while decoding only the parts they reach.
+"""
+import json
+import re
+from array import array
+from collections import Mapping, Sequence, OrderedDict
+from mmap import mmap, ACCESS_READ
+
+from wildpath import containers
+from wildpath.jsonstream import scan_structure
+
+__author__ = "Lars van Gemerden"
+
+
+_WS = re.compile(br"[ \t\n\r]*")
+_STRING = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"')
+_SCALAR = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"|[^,:\]}\s]+')
+_STRUCTURE = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"|(?P<open>[\[{])|(?P<close>[\]}])|(?P<incomplete>")')
+
+try:
+    array("q")
+    _OFFSET = "q"
+except ValueError:  # python 2
+    _OFFSET = "l"
+
+
+class JSONDocument(object):
+    """
+    JSON text (bytes or a memory mapped file) with lazy access to its values, through the view in 'root'. Only the
+    indices of accessed objects and arrays are kept.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._root = None
+
+    @classmethod
+    def open(cls, filename):
+        """ memory maps the file; opening is independent of the size of the file """
+        with open(filename, "rb") as f:
+            return cls(mmap(f.fileno(), 0, access=ACCESS_READ))
+
+    def close(self):
+        if isinstance(self.data, mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = self.value(self.skip_ws(0))
+        return self._root
+
+    def skip_ws(self, pos):
+        return _WS.match(self.data, pos).end()
+
+    def char(self, pos):
+        return self.data[pos:pos + 1]
+
+    def end(self, start):
+        """ the position just after the value starting at 'start' """
+        if self.char(start) in (b"{", b"["):
+            end, depth = scan_structure(self.data, start, 0, _STRUCTURE)
+            if depth:
+                raise ValueError("unexpected end of JSON input")
+            return end
+        match = _SCALAR.match(self.data, start)
+        if match is None:
+            raise ValueError("no JSON value at position %d" % start)
+        return match.end()
+
+    def decode(self, start, end=None):
+        """ decodes the value starting at 'start' (fully, also objects and arrays) """
+        return json.loads(self.data[start:end or self.end(start)].decode("utf-8"))
+
+    def value(self, start):
+        """ returns a view for an object or array starting at 'start', otherwise the decoded value """
+        char = self.char(start)
+        if char == b"{":
+            return JSONObject(self, start)
+        if char == b"[":
+            return JSONArray(self, start)
+        return self.decode(start)
+
+    def members(self, start):
+        """ iterates over the (key, value start) of the object starting at 'start' """
+        data, pos = self.data, self.skip_ws(start + 1)
+        if self.char(pos) == b"}":
+            return
+        while True:
+            match = _STRING.match(data, pos)
+            if match is None:
+                raise ValueError("expected a key at position %d" % pos)
+            key = match.group()
+            key = json.loads(key.decode("utf-8")) if b"\\" in key else key[1:-1].decode("utf-8")
+            pos = self.skip_ws(match.end())
+            if self.char(pos) != b":":
+                raise ValueError("expected ':' at position %d" % pos)
+            pos = self.skip_ws(pos + 1)
+            yield key, pos
+            pos = self.skip_ws(self.end(pos))
+            char = self.char(pos)
+            if char == b"}":
+                return
+            if char != b",":
+                raise ValueError("expected ',' or '}' at position %d" % pos)
+            pos = self.skip_ws(pos + 1)
+
+    def elements(self, start):
+        """ iterates over the value starts of the array starting at 'start' """
+        pos = self.skip_ws(start + 1)
+        if self.char(pos) == b"]":
+            return
+        while True:
+            yield pos
+            pos = self.skip_ws(self.end(pos))
+            char = self.char(pos)
+            if char == b"]":
+                return
+            if char != b",":
+                raise ValueError("expected ',' or ']' at position %d" % pos)
+            pos = self.skip_ws(pos + 1)
+
+
+class JSONView(object):
+    """ baseclass of the views of objects and arrays; views of nested objects and arrays are kept once accessed """
+
+    def __init__(self, document, start):
+        self.document = document
+        self.start = start
+        self._index = None
+        self._views = {}
+
+    def _value(self, key, start):
+        try:
+            return self._views[key]
+        except KeyError:
+            value = self.document.value(start)
+            if isinstance(value, JSONView):
+                self._views[key] = value
+            return value
+
+    def decode(self):
+        """ returns the (fully) decoded object or array """
+        return self.document.decode(self.start)
+
+    def __repr__(self):
+        return "%s(%d)" % (self.__class__.__name__, self.start)
+
+
+class JSONObject(JSONView, Mapping):
+
+    @property
+    def index(self):
+        """ key -> offset of the value, built on first access """
+        if self._index is None:
+            self._index = OrderedDict(self.document.members(self.start))
+        return self._index
+
+    def __getitem__(self, key):
+        return self._value(key, self.index[key])
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class JSONArray(JSONView, Sequence):
+
+    @property
+    def index(self):
+        """ offsets of the items, built on first access """
+        if self._index is None:
+            self._index = array(_OFFSET, self.document.elements(self.start))
+        return self._index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start = self.index[index]
+        return self._value(index % len(self), start)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, containers.value_sequence_types):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+
+class _ReadOnlyMixin(object):
+
+    def set(self, obj, key, value):
+        raise TypeError("JSON views are read-only")
+
+    def delete(self, obj, key):
+        raise TypeError("JSON views are read-only")
+
+    def delete_keys(self, obj, keys):
+        raise TypeError("JSON views are read-only")
+
+
+class JSONObjectHandler(_ReadOnlyMixin, containers.MappingHandler):
+
+    def new(self, obj, items):
+        return dict(items)
+
+
+class JSONArrayHandler(_ReadOnlyMixin, containers.SequenceHandler):
+
+    def new(self, obj, items):
+        return [v for _, v in items]
+
+
+containers.register(JSONObject, JSONObjectHandler())
+containers.register(JSONArray, JSONArrayHandler())
+
@@ -1,10 +1,15 @@
-from fnmatch import fnmatchcase
+import re
+from fnmatch import translate
+from functools import reduce
+from operator import methodcaller, and_, or_
 
 import sys
 from boolean import BooleanAlgebra, AND, OR, NOT, Symbol
 from boolean import ParseError, TOKEN_SYMBOL, TOKEN_NOT, TOKEN_AND, TOKEN_OR, TOKEN_LPAR, TOKEN_RPAR
 from boolean.boolean import PARSE_UNKNOWN_TOKEN
 
+from wildpath import indexsets
+
 
 try:
     basestring
@@ -12,55 +17,151 @@ except NameError:
     basestring = str
 
 
-class WildSymbol(Symbol):
+def _unique(keys):
+    seen = set()
+    return tuple(k for k in keys if not (k in seen or seen.add(k)))
+
+
+class _SelectionMixin(object):
+    """ evaluation of a parsed wild key on keys, shared by the symbol and the operators """
+
+    def __call__(self, *keys):
+        """ returns the set of selected keys; 'keys' are all strings or all the indices (range(n)) of a sequence """
+        if keys and not isinstance(keys[0], basestring):
+            return set(self.select_indices(len(keys)))
+        return self.select_keys(keys)
+
+
+class WildSymbol(_SelectionMixin, Symbol):
 
     ALL = object()
 
+    wild_chars = "*?["
+
     def __init__(self, wild_key, parse_slice_item=lambda v: int(v) if v else None):
+        self.literal = None
         if wild_key == '*' or wild_key == ':':
             super(WildSymbol, self).__init__(self.ALL)
         elif ':' in wild_key:
             super(WildSymbol, self).__init__(slice(*map(parse_slice_item, wild_key.split(':'))))
         else:
             super(WildSymbol, self).__init__(wild_key)
+            self._init_matching(wild_key)
 
-    def __call__(self, *keys):
+    def _init_matching(self, wild_key):
+        """
+        Compiles the wild key once: literal keys are looked up by hashing, pure prefix and suffix patterns use
+        str.startswith/endswith and other patterns a compiled regex. Matching keys are selected with filter(), so the
+        loop over (possibly many) keys runs in C.
+        """
+        stars = wild_key.count("*")
+        if not any(c in wild_key for c in self.wild_chars):
+            self.literal = wild_key
+        elif stars == 1 and not any(c in wild_key for c in "?[") and wild_key.endswith("*"):
+            self.match = methodcaller("startswith", wild_key[:-1])
+        elif stars == 1 and not any(c in wild_key for c in "?[") and wild_key.startswith("*"):
+            self.match = methodcaller("endswith", wild_key[1:])
+        else:
+            self.match = re.compile(translate(wild_key)).match
+
+    def literals(self):
+        """ returns the literal keys if the expression consists of literal keys and '|' only, otherwise None """
+        return None if self.literal is None else (self.literal,)
+
+    def candidates(self):
+        """ returns literal keys that include all keys the expression can match, or None if there are none """
+        return self.literals()
+
+    def select_keys(self, keys):
+        """ returns the set of (string) keys in collection 'keys' that match the wild key """
         wild_key = self.obj
-        if not len(keys) or wild_key is self.ALL:
+        if wild_key is self.ALL:
             return set(keys)
-        if isinstance(keys[0], str):  # all keys are str or all keys are int
-            return set(k for k in keys if fnmatchcase(k, wild_key))
+        if isinstance(wild_key, slice):  # slices only select indices
+            return set()
+        if self.literal is not None:
+            return {wild_key} if wild_key in keys else set()
         try:
-            index = int(wild_key)
-        except TypeError:
-            return set(range(*wild_key.indices(len(keys))))
-        else:
-            while index < 0:
-                index += len(keys)
-            return {index} if index in keys else set()
+            return set(filter(self.match, keys))
+        except (TypeError, AttributeError):  # not all keys are strings
+            return set(k for k in keys if self.match(str(k)))
+
+    def select_indices(self, length):
+        """ returns the IndexSet of indices in range(length) that match the wild key """
+        wild_key = self.obj
+        if wild_key is self.ALL:
+            return indexsets.full(length)
+        if isinstance(wild_key, slice):
+            return indexsets.from_slice(length, wild_key)
+        return indexsets.from_index(length, int(wild_key))
 
     def __lt__(self, other):
         """ due to small bug in boolean.py """
         return NotImplemented
 
+    def __hash__(self):
+        """ slice objects are not hashable (before python 3.12), but simplifying expressions requires hashing """
+        if isinstance(self.obj, slice):
+            return hash((self.obj.start, self.obj.stop, self.obj.step))
+        return super(WildSymbol, self).__hash__()
 
 
-class SET_NOT(NOT):
 
-    def __call__(self, *keys):
-        return set(keys) - self.args[0](*keys)
+class SET_NOT(_SelectionMixin, NOT):
 
+    def literals(self):
+        return None
 
-class SET_OR(OR):
+    def candidates(self):
+        return None
 
-    def __call__(self, *keys):
-        return set.union(*(a(*keys) for a in self.args))
+    def select_keys(self, keys):
+        return set(keys) - self.args[0].select_keys(keys)
 
+    def select_indices(self, length):
+        return ~self.args[0].select_indices(length)
 
-class SET_AND(AND):
 
-    def __call__(self, *keys):
-        return set.intersection(*(a(*keys) for a in self.args))
+class SET_OR(_SelectionMixin, OR):
+
+    def literals(self):
+        literals = [a.literals() for a in self.args]
+        if any(l is None for l in literals):
+            return None
+        return _unique(l for ls in literals for l in ls)
+
+    def candidates(self):
+        candidates = [a.candidates() for a in self.args]
+        if any(c is None for c in candidates):
+            return None
+        return _unique(c for cs in candidates for c in cs)
+
+    def select_keys(self, keys):
+        return set.union(*(a.select_keys(keys) for a in self.args))
+
+    def select_indices(self, length):
+        return reduce(or_, (a.select_indices(length) for a in self.args))
+
+
+class SET_AND(_SelectionMixin, AND):
+
+    def literals(self):
+        return None
+
+    def candidates(self):
+        candidates = [c for c in (a.candidates() for a in self.args) if c is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=len)
+
+    def select_keys(self, keys):
+        """ every next argument only needs to match the keys selected by the previous ones """
+        for a in self.args:
+            keys = a.select_keys(keys)
+        return keys
+
+    def select_indices(self, length):
+        return reduce(and_, (a.select_indices(length) for a in self.args))
 
 
 class KeyParser(BooleanAlgebra):
@@ -0,0 +1,126 @@
+from wildpath.containers import handler_for
+from wildpath.paths import BasePath, WildPath
+from wildpath.pathset import path_key, trie_path
+from wildpath.plan import WildStep
+
+__author__ = "Lars van Gemerden"
+
+
+SET, DEL = "set", "del"
+
+OPS = {"set": SET, "add": SET, "change": SET, "replace": SET,
+       "del": DEL, "delete": DEL, "remove": DEL}
+
+
+class PatchNode(object):
+    """
+    Node in a trie of patched paths: children are keyed by the (key, is wild) of the next step, 'op' is the (op, value)
+    of the path ending in this node, if any.
+    """
+
+    def __init__(self, step=None):
+        self.step = step
+        self.children = {}
+        self.op = None
+
+    def add(self, path, op, value):
+        trie_path(self, path)[-1].op = (op, value)
+
+    def apply(self, obj):
+        """
+        Applies the operations below this node to 'obj' at this node: first the sets, then the operations further
+        down the paths, then the deletes, all deletes in 'obj' at once.
+        """
+        children = list(self.children.values())
+        deletes = []
+        for child in children:
+            if child.op is not None:
+                if child.op[0] == SET:
+                    child.step.set(obj, child.op[1])
+                else:
+                    deletes.append(child.step)
+        for child in children:
+            if child.children:
+                step = child.step
+                if isinstance(step, WildStep):
+                    handler = handler_for(obj)
+                    for k in step.select(handler, obj):
+                        child.apply(handler.get(obj, k))
+                else:
+                    child.apply(step.lookup(obj))
+        if deletes:
+            self._delete(obj, deletes)
+
+    @staticmethod
+    def _delete(obj, steps):
+        handler = handler_for(obj)
+        if len(steps) == 1:
+            return steps[0].delete(obj)
+        keys = set()
+        for step in steps:
+            if isinstance(step, WildStep):
+                keys.update(step.select(handler, obj))
+            elif handler.indexed:
+                index = step.key_for(handler)
+                if not handler.contains(obj, index):
+                    raise IndexError("index %d out of range" % index)
+                keys.add(index % len(obj))
+            else:
+                keys.add(step.key_for(handler))
+        handler.delete_keys(obj, sorted(keys, reverse=True) if handler.indexed else keys)
+
+
+class Patch(object):
+    """
+    A set of updates (set or delete a value at a Path or WildPath) that is applied to an object in a single traversal:
+    common prefixes of the paths are looked up once. The updates are not applied one after the other: in each
+    container, sets are done first, then the updates deeper in the paths, then the deletes. So indices in a patch refer
+    to the positions before the patch is applied, e.g. deleting "items.0" and "items.2" deletes the first and third
+    item. Adding an update for a path that is already in the patch replaces the earlier update (see pathset.path_key()
+    for when paths are the same). An update with an empty path replaces the object itself, see apply().
+    """
+
+    def __init__(self, updates=()):
+        self.root = PatchNode()
+        self._updates = {}
+        for update in updates:
+            self.add(*update)
+
+    def add(self, path, op, value=None):
+        """ adds an update; 'op' is "set" (or "add", "change", "replace") or "del" (or "delete", "remove") """
+        if isinstance(path, str):
+            path = WildPath(path)
+        try:
+            op = OPS[op]
+        except KeyError:
+            raise ValueError("unknown patch operation: %r" % (op,))
+        if not len(path) and op == DEL:
+            raise ValueError("cannot delete the object itself (empty path)")
+        self._updates[path_key(path)] = (path, op, value)
+        self.root.add(path, op, value)
+
+    def set(self, path, value):
+        self.add(path, SET, value)
+
+    def delete(self, path):
+        self.add(path, DEL)
+
+    def __len__(self):
+        return len(self._updates)
+
+    def __iter__(self):
+        """ iterates over the (path, op, value) of the updates """
+        return iter(self._updates.values())
+
+    def __contains__(self, path):
+        return isinstance(path, BasePath) and path_key(path) in self._updates
+
+    def apply(self, obj):
+        """
+        Applies the updates to 'obj' (in place) and returns 'obj'; if the patch sets the object itself (empty path, e.g.
+        from diff()), the other updates are applied to the new value and the new value is returned.
+        """
+        if self.root.op is not None:
+            obj = self.root.op[1]
+        self.root.apply(obj)
+        return obj
@@ -1,77 +1,106 @@
 from copy import copy
-from collections import Mapping, Sequence, MutableMapping, MutableSequence
 from inspect import ismethod
+from itertools import islice
 
+from wildpath.accessors import Accessor
+from wildpath.containers import handler_for, get_object_dict, get_object_items
 from wildpath.keyparser import KeyParser
-from wildpath.tools import value_sequence_types, flatten
+from wildpath.plan import Plan, make_step, _marker
+from wildpath.tools import LRUCache
 
 __author__ = "Lars van Gemerden"
 
 
-_marker = object()
-
-
 class BasePath(tuple):
     """
     Helper classes to be able to use '.' separated paths to access elements in objects, lists and dictionaries.
     """
     sep = "."
 
+    instance_cache = LRUCache(maxsize=1024)  # shared instances, see BasePath.cached
+
+    @classmethod
+    def cached(cls, string):
+        """
+        Returns a shared, compiled instance for 'string'. Instances are kept in a bounded cache (BasePath.instance_cache)
+        so repeated construction from the same string costs a single lookup.
+        """
+        key = (cls, string)
+        path = cls.instance_cache.get(key)
+        if path is None:
+            path = cls(string)
+            path.compile()
+            cls.instance_cache[key] = path
+        return path
+
+    @classmethod
+    def clear_cache(cls):
+        """ clears the cache of shared instances (for all path classes) """
+        cls.instance_cache.clear()
+
     @classmethod
     def _get_object_items(cls, obj, _call=False):
-        for name in dir(obj):
-            if not (name.startswith("__") and name.endswith("__")):
-                attr = getattr(obj, name)
-                if name in obj.__dict__ or (_call and callable(attr)):
-                    yield name, attr
-                else:
-                    cls_attr = getattr(obj.__class__, name, None)
-                    if not callable(cls_attr):
-                        if (isinstance(cls_attr, property) or
-                                hasattr(cls_attr, "__get__") or
-                                hasattr(cls_attr, "__set__")):
-                            yield name, attr
+        return get_object_items(obj, _call)
 
     @classmethod
     def get_object_dict(cls, obj):
-        return {name: getattr(obj, name) for name in dir(obj) if not (name.startswith("__") and name.endswith("__"))
-                and not callable(getattr(obj, name))}
+        return get_object_dict(obj)
 
     @classmethod
-    def items(cls, obj, all=False, _path=None, _call=False):
-        """ iterates over all (wildpath, value) items in the (nested) object """
-        if _path is None:
-            _path = cls()
-        elif all:
-            yield _path, copy(obj)
+    def items(cls, obj, all=False, _path=None, _call=False, unique=False):
+        """
+        Iterates over all (path, value) items in the (nested) object, depth first, with an explicit stack (no recursion
+        limit). Objects that are already being iterated into (circular references) are yielded, but not iterated into
+        again; with unique=True this holds for all objects that were already iterated into (shared sub-objects).
+        """
+        keys = list(_path or ())
+        if _path is not None and all:
+            yield cls(keys), copy(obj)
         if _call and callable(obj):
-            yield _path, obj
-        elif isinstance(obj, value_sequence_types):
+            yield cls(keys), obj
+            return
+        handler = handler_for(obj)
+        if handler.leaf:
             if not all:
-                yield _path, obj
-        elif isinstance(obj, Mapping):
-            for key, sub_obj in obj.items():
-                for sub_path, sub_obj in cls.items(sub_obj, all, _path + cls(key), _call=_call):
-                    yield sub_path, sub_obj
-        elif isinstance(obj, Sequence):
-            for index, sub_obj in enumerate(obj):
-                for sub_path, sub_obj in cls.items(sub_obj, all, _path + cls(str(index)), _call=_call):
-                    yield sub_path, sub_obj
-        elif hasattr(obj, "__dict__"):
-            for key, sub_obj in cls._get_object_items(obj, _call):
-                for sub_path, sub_obj in cls.items(sub_obj, all, _path + cls(key), _call=_call):
-                    yield sub_path, sub_obj
-        elif not all:
-            yield _path, obj
+                yield cls(keys), obj
+            return
+        active = {id(obj): obj}  # objects on the stack; with unique=True all objects that were iterated into (kept alive)
+        stack = [(iter(handler.items(obj, _call)), handler.indexed, id(obj))]
+        while stack:
+            iterator, indexed, obj_id = stack[-1]
+            item = next(iterator, None)
+            if item is None:
+                stack.pop()
+                if not unique:
+                    del active[obj_id]
+                if stack:
+                    keys.pop()
+                continue
+            key, sub_obj = item
+            keys.append(str(key) if indexed else key)
+            if all:
+                yield cls(keys), copy(sub_obj)
+            if _call and callable(sub_obj):
+                yield cls(keys), sub_obj
+                keys.pop()
+                continue
+            handler = handler_for(sub_obj)
+            if handler.leaf or id(sub_obj) in active:
+                if not all:
+                    yield cls(keys), sub_obj
+                keys.pop()
+                continue
+            active[id(sub_obj)] = sub_obj
+            stack.append((iter(handler.items(sub_obj, _call)), handler.indexed, id(sub_obj)))
 
     @classmethod
-    def paths(cls, obj, all=False):
-        for sub_path, _ in cls.items(obj, all=all):
+    def paths(cls, obj, all=False, unique=False):
+        for sub_path, _ in cls.items(obj, all=all, unique=unique):
             yield sub_path
 
     @classmethod
-    def values(cls, obj, all=False):
-        for _, sub_obj in cls.items(obj, all=all):
+    def values(cls, obj, all=False, unique=False):
+        for _, sub_obj in cls.items(obj, all=all, unique=unique):
             yield sub_obj
 
     def __new__(cls, string_or_seq=None):
@@ -92,16 +121,27 @@ class BasePath(tuple):
     def get_in(self, obj, default=_marker):
         return self._get_in(obj, default)
 
-    def set_in(self, obj, value):
+    def set_in(self, obj, value, copy=False):
+        """
+        Sets the item(s) at path 'self' in 'obj' to 'value'. With copy=True, 'obj' is not changed: a copy is returned
+        that shares all unchanged parts with 'obj', only the containers along the path are (shallow) copied.
+        """
+        if copy:
+            return self._set_copy(obj, value)
         return self._set_in(obj, value)
 
-    def del_in(self, obj):
+    def del_in(self, obj, copy=False):
+        """ deletes the item(s) at path 'self' from 'obj'; with copy=True a copy is returned, as for set_in """
+        if copy:
+            return self._del_copy(obj)
         return self._del_in(obj)
 
     def pop_in(self, obj):
-        result = self._get_in(obj)
-        self._del_in(obj)
-        return result
+        return self._pop_in(obj)
+
+    def apply_in(self, obj, func):
+        """ replaces the item(s) at path 'self' in 'obj' with func(item) """
+        return self._apply_in(obj, func)
 
     def has_in(self, obj):
         """checks presence of item at wildpath 'self' from the 'obj'"""
@@ -111,6 +151,9 @@ class BasePath(tuple):
             return False
         return True
 
+    def compile(self):
+        raise NotImplementedError
+
     def call_in(self, obj, *args, **kwargs):
         raise NotImplementedError
 
@@ -123,6 +166,18 @@ class BasePath(tuple):
     def _del_in(self, obj):
         raise NotImplementedError
 
+    def _pop_in(self, obj):
+        raise NotImplementedError
+
+    def _apply_in(self, obj, func):
+        raise NotImplementedError
+
+    def _set_copy(self, obj, value):
+        raise NotImplementedError
+
+    def _del_copy(self, obj):
+        raise NotImplementedError
+
     def __add__(self, other):
         return self.__class__(tuple.__add__(self, other))
 
@@ -135,59 +190,99 @@ class Path(BasePath):
     Fast implementation of the baseclass that does not allow wildcards and slicing.
     """
 
+    _accessor = None
+
+    def compile(self):
+        """
+        Opt-in: generates specialized get, set and delete functions for this path (see wildpath.accessors). After
+        this, get_in, set_in and del_in of this path use the generated functions.
+        """
+        if self._accessor is None:
+            self._accessor = Accessor(self)
+        return self._accessor
+
     def call_in(self, obj, *args, **kwargs):
         return self.get_in(obj)(*args, **kwargs)
 
     def _get_in(self, obj, default=_marker):
         """returns item at wildpath 'self' from the 'obj'"""
-        try:
-            for key in self:
-                if isinstance(obj, Mapping):
-                    obj = obj[key]
-                elif isinstance(obj, Sequence):
-                    obj = obj[int(key)]
-                else:
-                    obj = getattr(obj, key)
-        except (KeyError, IndexError, AttributeError):
-            if default is _marker:
-                raise
-            return default
-        else:
-            return obj
+        if default is not _marker:
+            return self._probe_in(obj, default)
+        if self._accessor is not None:
+            return self._accessor.get(obj)
+        for key in self:
+            handler = handler_for(obj)
+            obj = handler.get(obj, int(key) if handler.indexed else key)
+        return obj
+
+    def _probe_in(self, obj, default):
+        """as _get_in, but missing keys are detected without raising exceptions (see Handler.probe)"""
+        if self._accessor is not None:
+            return self._accessor.probe(obj, default)
+        for key in self:
+            handler = handler_for(obj)
+            obj = handler.probe(obj, int(key) if handler.indexed else key, _marker)
+            if obj is _marker:
+                return default
+        return obj
 
     def _set_in(self, obj, value):
         """sets item at wildpath 'self' from the 'obj' to 'value'"""
+        if self._accessor is not None:
+            return self._accessor.set(obj, value)
         obj = self[:-1]._get_in(obj)
-        if isinstance(obj, MutableMapping):
-            obj[self[-1]] = value
-        elif isinstance(obj, MutableSequence):
-            obj[int(self[-1])] = value
-        else:
-            setattr(obj, self[-1], value)
+        handler = handler_for(obj)
+        handler.set(obj, int(self[-1]) if handler.indexed else self[-1], value)
 
     def _del_in(self, obj):
         """deletes item at wildpath 'self' from the 'obj'"""
+        if self._accessor is not None:
+            return self._accessor.delete(obj)
         obj = self[:-1]._get_in(obj)
-        if isinstance(obj, MutableMapping):
-            del obj[self[-1]]
-        elif isinstance(obj, MutableSequence):
-            del obj[int(self[-1])]
-        else:
-            delattr(obj, self[-1])
-
+        handler = handler_for(obj)
+        handler.delete(obj, int(self[-1]) if handler.indexed else self[-1])
 
-def _get_with_key(value, k):
-    if isinstance(value, Mapping):
-        return value[k]
-    return value
-
-
-def _get_with_index(value, index):
-    if isinstance(value, value_sequence_types):
+    def _pop_in(self, obj):
+        """deletes and returns item at path 'self' from the 'obj'"""
+        obj = self[:-1]._get_in(obj)
+        handler = handler_for(obj)
+        key = int(self[-1]) if handler.indexed else self[-1]
+        value = handler.get(obj, key)
+        handler.delete(obj, key)
         return value
-    if isinstance(value, Sequence):
-        return value[index]
-    return value
+
+    def _apply_in(self, obj, func):
+        """replaces item at path 'self' in 'obj' with func(item)"""
+        obj = self[:-1]._get_in(obj)
+        handler = handler_for(obj)
+        key = int(self[-1]) if handler.indexed else self[-1]
+        handler.set(obj, key, func(handler.get(obj, key)))
+
+    def _copy_parent(self, obj):
+        """copies the containers along the path to the parent of the item; returns (copy of obj, copy of parent)"""
+        root = parent = handler_for(obj).copy(obj)
+        for key in self[:-1]:
+            handler = handler_for(parent)
+            key = int(key) if handler.indexed else key
+            child = handler.get(parent, key)
+            child = handler_for(child).copy(child)
+            handler.set(parent, key, child)
+            parent = child
+        return root, parent
+
+    def _set_copy(self, obj, value):
+        """returns a copy of 'obj' with the item at path 'self' set to 'value'"""
+        root, parent = self._copy_parent(obj)
+        handler = handler_for(parent)
+        handler.set(parent, int(self[-1]) if handler.indexed else self[-1], value)
+        return root
+
+    def _del_copy(self, obj):
+        """returns a copy of 'obj' without the item at path 'self'"""
+        root, parent = self._copy_parent(obj)
+        handler = handler_for(parent)
+        handler.delete(parent, int(self[-1]) if handler.indexed else self[-1])
+        return root
 
 
 class WildPath(BasePath):
@@ -201,164 +296,148 @@ class WildPath(BasePath):
 
     algebra = KeyParser()
 
-    _preprocessed = {}
+    key_cache = LRUCache(maxsize=4096)  # parsed wild keys, see WildPath.parse_key
+
+    _plan = None
 
-    def __new__(cls, string_or_seq=None, _parse=algebra.parse, _tokens=tokens):
+    def __new__(cls, string_or_seq=None):
         self = super(WildPath, cls).__new__(cls, string_or_seq)
-        preprocessed = cls._preprocessed
+        key_cache = cls.key_cache
+        depth = -1
         for wild_key in self:
             #  if wild_cards or slicing is used, multiple results are returned and the boolean logic is applied
-            if wild_key not in preprocessed and any(t in wild_key for t in _tokens):
-                preprocessed[wild_key] = _parse(wild_key, simplify=True)
-        self.depth = self._get_depth()
+            if wild_key in key_cache:  # no lock or reordering for keys that are already parsed
+                depth += 1
+            elif cls.is_wild(wild_key):
+                cls.parse_key(wild_key)
+                depth += 1
+        self.depth = depth
         return self
 
-    def _get_depth(self):
-        prep = self._preprocessed
-        return len([k for k in self if k in prep])-1
+    @classmethod
+    def is_wild(cls, key, _tokens=tokens):
+        return any(t in key for t in _tokens)
+
+    @classmethod
+    def parse_key(cls, wild_key):
+        """ returns the parsed expression for a wild key; parsed keys are kept in the bounded cache WildPath.key_cache """
+        expression = cls.key_cache.get(wild_key)
+        if expression is None:
+            expression = cls.key_cache[wild_key] = cls.algebra.parse(wild_key, simplify=True)
+        return expression
+
+    @classmethod
+    def key_cache_stats(cls):
+        """ returns a dict with the hits, misses, evictions, size and maxsize of the cache of parsed wild keys """
+        return cls.key_cache.stats()
+
+    def compile(self):
+        """
+        Returns the path as a flat plan of steps (see wildpath.plan), which is used by get_in, set_in and del_in.
+        The plan is created once per path; keys are parsed and indices are converted to int at that time.
+        """
+        if self._plan is None:
+            self._plan = Plan(make_step(k, self.parse_key(k) if self.is_wild(k) else None) for k in self)
+        return self._plan
+
+    def match_items(self, obj):
+        """
+        Iterates over the (Path, value) items of all matches of the wildpath in 'obj'. Only the parts of 'obj' the
+        wildpath can match are visited (unlike WildPath.items(obj)). As in the iterators, leaf objects (e.g. strings)
+        are not iterated into.
+        """
+        for keys, value in self.compile().items(obj):
+            yield tuple.__new__(Path, keys), value
+
+    def iter_in(self, obj, limit=None):
+        """
+        Lazily iterates over the (Path, value) items of the matches in 'obj' (see match_items), at most
+        'limit' items; obj is only traversed as far as needed for the items that are consumed.
+        """
+        if limit is None:
+            return self.match_items(obj)
+        return islice(self.match_items(obj), limit)
+
+    def first_in(self, obj, default=_marker):
+        """ returns the value of the first match in 'obj'; if there is none, 'default' or a KeyError """
+        for _, value in self.match_items(obj):
+            return value
+        if default is _marker:
+            raise KeyError("no match for '%s'" % str(self))
+        return default
 
     def call_in(self, obj, *args, **kwargs):
-        results = self.get_in(obj)
-        for path, instance_method in Path.items(results, _call=True):
-            path.set_in(results, instance_method(*args, **kwargs))
-        return results
+        """
+        Calls the method(s) at wildpath 'self' in 'obj'; returns the results in the structure get_in returns. In a
+        selected value that is not callable itself, all callables (see Path.items(..., _call=True)) are called and
+        replaced by their results.
+        """
+        def call(value):
+            if callable(value):
+                return value(*args, **kwargs)
+            for path, method in Path.items(value, _call=True):
+                path.set_in(value, method(*args, **kwargs))
+            return value
+        return self.compile().get_mapped(obj, call)
+
+    def has_in(self, obj, any=False):
+        """
+        Checks presence of the item(s) at wildpath 'self' in 'obj': with any=False whether all keys in the wildpath are
+        present (get_in would not raise an exception), with any=True whether there is at least one match. Stops at
+        the first missing key resp. the first match, without building a result.
+        """
+        plan = self.compile()
+        return plan.has_any(obj) if any else plan.has(obj)
+
+    def matches(self, path):
+        """
+        Whether the concrete 'path' (a Path, str or sequence of keys, with indices as str as in Path.items) is one of
+        the paths selected by 'self', independent of any object. Indices counted from the end of a sequence (e.g. "-1")
+        depend on its length and do not match. To match a path against many wildpaths, see wildpath.patterns.
+        """
+        if isinstance(path, str):
+            path = Path(path)
+        plan = self.compile()
+        if len(path) != len(plan):
+            return False
+        for step, key in zip(plan, path):
+            if not step.matches_key(str(key)):
+                return False
+        return True
 
     def get_in(self, obj, default=_marker, flat=False):
-        result = super(WildPath, self).get_in(obj, default)
+        """ returns item(s) at wildpath 'self' from the 'obj'; with flat=True as a flat list of the values """
         if flat:
-            return flatten(result, depth=self.depth)
-        return result
+            return self.compile().get_flat(obj, default)
+        return self._get_in(obj, default)
 
-    def _get_in(self, obj, default=_marker, _preprocessed=_preprocessed):
+    def _get_in(self, obj, default=_marker):
         """returns item(s) at wildpath 'self' from the 'obj'"""
-        if not len(self):
-            return obj
-        key = self[0]
-        if key in _preprocessed:  # this is not a single key or index
-            if len(self) == 1:
-                if isinstance(obj, Mapping):
-                    return obj.__class__((k, obj[k]) for k in _preprocessed[key](*obj))
-                elif isinstance(obj, Sequence):
-                    return obj.__class__(obj[i] for i in _preprocessed[key](*range(len(obj))))
-                else:
-                    obj_dict = self.get_object_dict(obj)
-                    return {k: obj_dict[k] for k in _preprocessed[key](*obj_dict)}
-            else:
-                if isinstance(obj, Mapping):
-                    return obj.__class__((k, self[1:]._get_in(obj[k], default)) for k in _preprocessed[key](*obj))
-                elif isinstance(obj, Sequence):
-                    return obj.__class__(self[1:].get_in(obj[i], default) for i in _preprocessed[key](*range(len(obj))))
-                else:
-                    obj_dict = self.get_object_dict(obj)
-                    return {k: self[1:]._get_in(obj_dict[k], default) for k in _preprocessed[key](*obj_dict)}
-        else:
-            if len(self) == 1:
-                try:
-                    if isinstance(obj, Mapping):
-                        return obj[key]
-                    elif isinstance(obj, Sequence):
-                        return obj[int(key)]
-                    else:
-                        return getattr(obj, key)
-                except (KeyError, IndexError, AttributeError):
-                    if default is _marker:
-                        raise
-                    return default
-            else:
-                if isinstance(obj, Mapping):
-                    return self[1:]._get_in(obj[key], default)
-                elif isinstance(obj, Sequence):
-                    return self[1:]._get_in(obj[int(key)], default)
-                else:
-                    return self[1:]._get_in(getattr(obj, key), default)
-
-    def _set_in(self, obj, value, get_with_key=_get_with_key,  # speed up function access
-                                  get_with_index=_get_with_index,
-                                  _preprocessed=_preprocessed):
+        return self.compile().get(obj, default)
+
+    def _set_in(self, obj, value):
         """sets item(s) at wildpath 'self' of 'obj' to 'value'"""
-        key = self[0]
-        if key in _preprocessed:
-            if len(self) == 1:
-                if isinstance(obj, MutableMapping):
-                    for k in _preprocessed[key](*obj):
-                        obj[k] = get_with_key(value, k)
-                elif isinstance(obj, MutableSequence):
-                    for i, j in enumerate(_preprocessed[key](*range(len(obj)))):
-                        obj[j] = get_with_index(value, i)
-                else:
-                    for k in _preprocessed[key](*self.get_object_dict(obj)):
-                        setattr(obj, k, get_with_key(value, k))
-            else:
-                if isinstance(obj, MutableMapping):
-                    for k in _preprocessed[key](*obj):
-                        self[1:]._set_in(obj[k], get_with_key(value, k))
-                elif isinstance(obj, MutableSequence):
-                    for i, j in enumerate(_preprocessed[key](*range(len(obj)))):
-                        self[1:]._set_in(obj[j], get_with_index(value, i))
-                else:
-                    obj_dict = self.get_object_dict(obj)
-                    for k in _preprocessed[key](*obj_dict):
-                        self[1:]._set_in(obj_dict[k], get_with_key(value, k))
-        else:
-            if len(self) == 1:
-                if isinstance(obj, MutableMapping):
-                    obj[key] = value
-                elif isinstance(obj, MutableSequence):
-                    obj[int(key)] = value
-                else:
-                    setattr(obj, key, value)
-            else:
-                if isinstance(obj, MutableMapping):
-                    self[1:]._set_in(obj[key], _get_with_key(value, key))
-                elif isinstance(obj, MutableSequence):
-                    self[1:]._set_in(obj[int(key)], _get_with_index(value, int(key)))
-                else:
-                    self[1:]._set_in(getattr(obj, key), _get_with_key(value, key))
-
-
-    def _del_in(self, obj, _preprocessed=_preprocessed):
+        return self.compile().set(obj, value)
+
+    def _del_in(self, obj):
         """deletes item(s) at wildpath 'self' from the 'obj'"""
-        key = self[0]
-        if key in _preprocessed:
-            if len(self) == 1:
-                if isinstance(obj, MutableMapping):
-                    for k in _preprocessed[key](*obj):
-                        del obj[k]
-                elif isinstance(obj, MutableSequence):
-                    for i in _preprocessed[key](*range(len(obj))):
-                        obj[i] = _marker  # marked for deletion
-                    obj[:] = [v for v in obj if v is not _marker]
-                else:
-                    for k in _preprocessed[key](*self.get_object_dict(obj)):
-                        delattr(obj, k)
-            else:
-                if isinstance(obj, MutableMapping):
-                    for k in _preprocessed[key](*obj):
-                        self[1:]._del_in(obj[k])
-                elif isinstance(obj, MutableSequence):
-                    for i in _preprocessed[key](*range(len(obj))):
-                        self[1:]._del_in(obj[i])
-                else:
-                    obj_dict = self.get_object_dict(obj)
-                    for k in _preprocessed[key](*obj_dict):
-                        self[1:]._del_in(obj_dict[k])
-        else:
-            if len(self) == 1:
-                if isinstance(obj, MutableMapping):
-                    del obj[key]
-                elif isinstance(obj, MutableSequence):
-                    del obj[int(key)]
-                else:
-                    delattr(obj, key)
-            else:
-                if isinstance(obj, MutableMapping):
-                    self[1:]._del_in(obj[key])
-                elif isinstance(obj, MutableSequence):
-                    self[1:]._del_in(obj[int(key)])
-                else:
-                    self[1:]._del_in(getattr(obj, key))
+        return self.compile().delete(obj)
+
+    def _pop_in(self, obj):
+        """deletes and returns item(s) at wildpath 'self' from the 'obj'"""
+        return self.compile().pop(obj)
+
+    def _apply_in(self, obj, func):
+        """replaces item(s) at wildpath 'self' in 'obj' with func(item)"""
+        return self.compile().apply(obj, func)
 
+    def _set_copy(self, obj, value):
+        """returns a copy of 'obj' with item(s) at wildpath 'self' set to 'value'"""
+        return self.compile().set_copy(obj, value)
 
+    def _del_copy(self, obj):
+        """returns a copy of 'obj' without item(s) at wildpath 'self'"""
+        return self.compile().delete_copy(obj)
 
 
 if __name__ == "__main__":
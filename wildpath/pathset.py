@@ -0,0 +1,118 @@
+from wildpath.containers import handler_for
+from wildpath.paths import BasePath, WildPath
+from wildpath.plan import WildStep, make_step, _marker
+
+__author__ = "Lars van Gemerden"
+
+
+def path_key(path):
+    """
+    Key of a path in sets and dicts of paths: the (key, is wild) of its steps, as in the tries below. So a Path and a
+    WildPath with the same keys are different paths if a key is wild in the WildPath (e.g. "*").
+    """
+    wild = isinstance(path, WildPath)
+    return tuple((key, wild and path.is_wild(key)) for key in path)
+
+
+def trie_path(node, path):
+    """
+    Returns the nodes along 'path' in the trie below 'node' (starting with 'node'), adding missing nodes. The children
+    of a node are keyed by the (key, is wild) of the next step and created as type(node)(step); keys are only parsed
+    for WildPath's.
+    """
+    nodes = [node]
+    for key in path:
+        expression = path.parse_key(key) if isinstance(path, WildPath) and path.is_wild(key) else None
+        child = node.children.get((key, expression is not None))
+        if child is None:
+            child = node.children[(key, expression is not None)] = type(node)(make_step(key, expression))
+        nodes.append(child)
+        node = child
+    return nodes
+
+
+class PathNode(object):
+    """
+    Node in a trie of paths: children are keyed by the (key, is wild) of the next step, 'ends' are the paths ending
+    in this node and 'paths' are all paths ending in this node or below it.
+    """
+
+    def __init__(self, step=None):
+        self.step = step
+        self.children = {}
+        self.ends = []
+        self.paths = []
+
+    def add(self, path):
+        """ adds 'path' (Path or WildPath) to the trie below this node """
+        nodes = trie_path(self, path)
+        for node in nodes:
+            node.paths.append(path)
+        nodes[-1].ends.append(path)
+
+    def resolve(self, obj, default=_marker):
+        """
+        Returns a dict {id(path): result} for all paths in and below this node, for 'obj' at this node (keyed by id,
+        because a Path and a WildPath with the same keys compare equal).
+        """
+        results = dict.fromkeys(map(id, self.ends), obj)
+        for child in self.children.values():
+            step = child.step
+            if isinstance(step, WildStep):
+                handler = handler_for(obj)
+                subs = [(k, child.resolve(handler.get(obj, k), default)) for k in step.select(handler, obj)]
+                for path in child.paths:
+                    results[id(path)] = handler.new(obj, ((k, sub[id(path)]) for k, sub in subs))
+            elif default is _marker:
+                results.update(child.resolve(step.lookup(obj), default))
+            else:
+                sub_obj = step.probe(obj, _marker)
+                if sub_obj is _marker:
+                    results.update(dict.fromkeys(map(id, child.paths), default))
+                else:
+                    results.update(child.resolve(sub_obj, default))
+        return results
+
+
+class PathSet(object):
+    """
+    A set of Path's and/or WildPath's that are looked up together: common prefixes of the paths (e.g. the
+    "routes.0.legs.0" in "routes.0.legs.0.distance" and "routes.0.legs.0.duration") are resolved once per object.
+    """
+
+    def __init__(self, paths=()):
+        self.root = PathNode()
+        self._paths = set()
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        """ adds a path; strings are converted to WildPath """
+        if isinstance(path, str):
+            path = WildPath(path)
+        key = path_key(path)
+        if key not in self._paths:
+            self._paths.add(key)
+            self.root.add(path)
+
+    def __len__(self):
+        return len(self.root.paths)
+
+    def __iter__(self):
+        return iter(self.root.paths)
+
+    def __contains__(self, path):
+        return isinstance(path, BasePath) and path_key(path) in self._paths
+
+    def items(self, obj, default=_marker):
+        """ returns a list of the (path, path.get_in(obj)) of all paths in the set, see get_in() """
+        results = self.root.resolve(obj, default)
+        return [(path, results[id(path)]) for path in self.root.paths]
+
+    def get_in(self, obj, default=_marker):
+        """
+        Returns a dict {path: path.get_in(obj)} for all paths in the set, in a single traversal of 'obj'. If 'default'
+        is given, it is the result for paths that cannot be found. Note that a Path and a WildPath with the same keys
+        are equal as dict keys; use items() if the set contains both.
+        """
+        return dict(self.items(obj, default))
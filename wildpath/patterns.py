@@ -0,0 +1,85 @@
+from wildpath.paths import Path, WildPath
+from wildpath.plan import WildStep
+
+__author__ = "Lars van Gemerden"
+
+
+class PatternNode(object):
+    """
+    Node in a trie of wildpaths: literal keys lead to children by hashing, wild keys (shared by all patterns with the
+    same key at this node) have to be matched. 'ends' are the patterns ending in this node.
+    """
+
+    def __init__(self):
+        self.literals = {}  # key -> PatternNode
+        self.wilds = {}  # wild key -> (WildStep, PatternNode)
+        self.ends = []
+
+    def child(self, step):
+        if isinstance(step, WildStep):
+            if step.key not in self.wilds:
+                self.wilds[step.key] = (step, PatternNode())
+            return self.wilds[step.key][1]
+        if step.key not in self.literals:
+            self.literals[step.key] = PatternNode()
+        return self.literals[step.key]
+
+
+class PatternIndex(object):
+    """
+    Index of many WildPath's (patterns) to find the patterns that match a concrete Path (see WildPath.matches). The
+    patterns are kept in a trie, so a lookup follows the literal keys of the path and only matches the wild keys on
+    the way: the cost depends on the length of the path and the number of different wild keys met, not on the number
+    of patterns.
+    """
+
+    def __init__(self, patterns=()):
+        self.root = PatternNode()
+        self._patterns = set()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        """ adds a pattern; strings are converted to WildPath """
+        if isinstance(pattern, str):
+            pattern = WildPath(pattern)
+        if pattern in self._patterns:
+            return
+        self._patterns.add(pattern)
+        node = self.root
+        for step in pattern.compile():
+            node = node.child(step)
+        node.ends.append(pattern)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self._patterns
+
+    def match(self, path):
+        """ returns a list of the patterns that match the concrete 'path' (a Path, str or sequence of keys) """
+        if isinstance(path, str):
+            path = Path(path)
+        nodes = [self.root]
+        for key in path:
+            key = str(key)
+            matched = {}  # wild key -> whether it matches 'key', shared by the nodes at this depth
+            next_nodes = []
+            for node in nodes:
+                child = node.literals.get(key)
+                if child is not None:
+                    next_nodes.append(child)
+                for wild_key, (step, child) in node.wilds.items():
+                    match = matched.get(wild_key)
+                    if match is None:
+                        match = matched[wild_key] = step.matches_key(key)
+                    if match:
+                        next_nodes.append(child)
+            if not next_nodes:
+                return []
+            nodes = next_nodes
+        return [pattern for node in nodes for pattern in node.ends]
@@ -0,0 +1,435 @@
+from wildpath.containers import handler_for, MAPPING, SEQUENCE
+
+__author__ = "Lars van Gemerden"
+
+
+_marker = object()
+
+
+def _get_with_key(value, k):
+    if handler_for(value).kind == MAPPING:
+        return value[k]
+    return value
+
+
+def _get_with_index(value, index):
+    handler = handler_for(value)
+    if handler.kind == SEQUENCE and not handler.leaf:
+        return value[index]
+    return value
+
+
+def _length_independent(expression):
+    """ whether selecting an index does not depend on the length of the sequence (no negative indices or steps) """
+    for symbol in expression.get_symbols():
+        key = symbol.obj
+        if key is symbol.ALL:
+            continue
+        if isinstance(key, slice):
+            if any(v is not None and v < 0 for v in (key.start, key.stop, key.step)):
+                return False
+        elif not key.isdigit():
+            return False
+    return True
+
+
+class Step(object):
+    """
+    A single compiled key of a path; steps are chained through 'next', the last step has 'next' set to None.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.next = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.key)
+
+
+class KeyStep(Step):
+    """ step for a literal key; looks up mapping keys and attributes """
+
+    index = None
+
+    def key_for(self, handler):
+        if handler.indexed:
+            return int(self.key)  # raises ValueError, like the uncompiled path
+        return self.key
+
+    def matches(self, key):
+        """ whether the (mapping) key is selected by this step """
+        return key == self.key
+
+    def matches_key(self, key):
+        """ whether the key of a concrete path is this key """
+        return key == self.key
+
+    def lookup(self, obj):
+        handler = handler_for(obj)
+        return handler.get(obj, self.key_for(handler))
+
+    def probe(self, obj, default=None):
+        """ as lookup(), returning 'default' instead of raising if the key is missing """
+        handler = handler_for(obj)
+        return handler.probe(obj, self.key_for(handler), default)
+
+    def get(self, obj, default=_marker):
+        if self.next is None:
+            if default is _marker:
+                return self.lookup(obj)
+            return self.probe(obj, default)
+        return self.next.get(self.lookup(obj), default)
+
+    def has(self, obj):
+        """ whether get() would succeed, without building the result """
+        value = self.probe(obj, _marker)
+        if value is _marker:
+            return False
+        return self.next is None or self.next.has(value)
+
+    def get_flat(self, obj, default, out):
+        """ appends the result values to list 'out', instead of building the nested result """
+        if self.next is None:
+            out.append(self.get(obj, default))
+        else:
+            self.next.get_flat(self.lookup(obj), default, out)
+
+    def items(self, obj, keys=()):
+        """ iterates over the (keys, value) of the matches in 'obj'; missing keys are not matches """
+        handler = handler_for(obj)
+        try:
+            key = self.key_for(handler)
+            value = handler.get(obj, key)
+        except (KeyError, IndexError, AttributeError, ValueError):
+            return
+        keys += (str(key % len(obj)) if handler.indexed else key,)  # the concrete index, e.g. "-1" -> "2"
+        if self.next is None:
+            yield keys, value
+        else:
+            for item in self.next.items(value, keys):
+                yield item
+
+    def get_mapped(self, obj, func):
+        """ as get(), with 'func' applied to the result values """
+        if self.next is None:
+            return func(self.lookup(obj))
+        return self.next.get_mapped(self.lookup(obj), func)
+
+    def set(self, obj, value):
+        if self.next is not None:
+            return self.next.set(self.lookup(obj), value)
+        handler = handler_for(obj)
+        handler.set(obj, self.key_for(handler), value)
+
+    def set_copy(self, obj, value):
+        """ as set(), but returns a copy of 'obj'; only the containers along the path are copied """
+        handler = handler_for(obj)
+        key = self.key_for(handler)
+        if self.next is not None:
+            value = self.next.set_copy(handler.get(obj, key), value)
+        return _copy_with(handler, obj, [(key, value)])
+
+    def delete_copy(self, obj):
+        """ as delete(), but returns a copy of 'obj'; only the containers along the path are copied """
+        handler = handler_for(obj)
+        key = self.key_for(handler)
+        if self.next is not None:
+            return _copy_with(handler, obj, [(key, self.next.delete_copy(handler.get(obj, key)))])
+        new = handler.copy(obj)
+        handler.delete(new, key)
+        return new
+
+    def apply(self, obj, func):
+        if self.next is not None:
+            return self.next.apply(self.lookup(obj), func)
+        handler = handler_for(obj)
+        key = self.key_for(handler)
+        handler.set(obj, key, func(handler.get(obj, key)))
+
+    def pop(self, obj):
+        if self.next is not None:
+            return self.next.pop(self.lookup(obj))
+        handler = handler_for(obj)
+        key = self.key_for(handler)
+        value = handler.get(obj, key)
+        handler.delete(obj, key)
+        return value
+
+    def delete(self, obj):
+        if self.next is not None:
+            return self.next.delete(self.lookup(obj))
+        handler = handler_for(obj)
+        handler.delete(obj, self.key_for(handler))
+
+
+class IndexStep(KeyStep):
+    """ step for a literal key that is also a valid index; the int conversion is done once, at compile time """
+
+    def __init__(self, key):
+        super(IndexStep, self).__init__(key)
+        self.index = int(key)
+
+    def key_for(self, handler):
+        if handler.indexed:
+            return self.index
+        return self.key
+
+
+class WildStep(Step):
+    """
+    Step for a key with wildcards, slices and/or boolean logic. The same expression can select keys of a mapping
+    or object (key-set matching) or indices of a sequence (index-set matching), depending on the object it meets.
+    """
+
+    def __init__(self, key, expression):
+        super(WildStep, self).__init__(key)
+        self.expression = expression
+        self.literals = expression.literals()  # e.g. "a|b|c"
+        self.candidates = expression.candidates()  # e.g. "a|b" or "a&!b*", bounded by literal keys
+        self.length_independent = _length_independent(expression)
+
+    def matches(self, key):
+        """ whether the (mapping) key is selected by this step """
+        return bool(self.expression.select_keys((key,)))
+
+    def matches_key(self, key):
+        """
+        Whether the key of a concrete path (with indices as str, as in Path.items) can be selected by this step, as a
+        mapping key or as an index. Whether an index is selected by e.g. "-1" or "::-2" depends on the length of the
+        sequence; such indices do not match.
+        """
+        if self.matches(key):
+            return True
+        if not (self.length_independent and key.isdigit()):
+            return False
+        index = int(key)
+        return index in self.expression.select_indices(index + 1)
+
+    def select(self, handler, obj):
+        """
+        Returns the keys or indices in 'obj' selected by the expression. Expressions bounded by literal keys are
+        evaluated by looking up these keys, all keys of 'obj' are only needed for wildcards and negation. Indices are
+        computed from len(obj) as an IndexSet (see wildpath.indexsets).
+        """
+        if handler.indexed:
+            return self.expression.select_indices(len(obj))
+        if self.candidates is not None:
+            keys = [k for k in self.candidates if handler.contains(obj, k)]
+            if self.literals is not None:
+                return keys
+            return self.expression.select_keys(keys)
+        return self.expression.select_keys(handler.keys(obj))
+
+    def get(self, obj, default=_marker):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        if nxt is None:
+            return handler.new(obj, ((k, get(obj, k)) for k in self.select(handler, obj)))
+        return handler.new(obj, ((k, nxt.get(get(obj, k), default)) for k in self.select(handler, obj)))
+
+    def has(self, obj):
+        handler = handler_for(obj)
+        keys = self.select(handler, obj)
+        if self.next is None:
+            return True
+        get, has = handler.get, self.next.has
+        for k in keys:
+            if not has(get(obj, k)):
+                return False
+        return True
+
+    def get_flat(self, obj, default, out):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        if nxt is None:
+            out.extend(get(obj, k) for k in self.select(handler, obj))
+        else:
+            for k in self.select(handler, obj):
+                nxt.get_flat(get(obj, k), default, out)
+
+    def items(self, obj, keys=()):
+        """
+        Iterates over the (keys, value) of the matches in 'obj', in the order of the keys in 'obj'. Like the iterators
+        (Path.items(obj), ...), it does not iterate into leaf objects (e.g. strings).
+        """
+        handler = handler_for(obj)
+        if handler.leaf:
+            return
+        try:
+            selected = self.select(handler, obj)
+        except ValueError:  # e.g. a key that is not an index in a sequence
+            return
+        if not (handler.indexed or self.candidates is not None):
+            selected = [k for k in handler.keys(obj) if k in selected]
+        get, nxt = handler.get, self.next
+        for k in selected:
+            sub_keys = keys + (str(k) if handler.indexed else k,)
+            if nxt is None:
+                yield sub_keys, get(obj, k)
+            else:
+                for item in nxt.items(get(obj, k), sub_keys):
+                    yield item
+
+    def set(self, obj, value):
+        handler = handler_for(obj)
+        nxt = self.next
+        if handler.indexed:
+            items = ((j, _get_with_index(value, i)) for i, j in enumerate(self.select(handler, obj)))
+        else:
+            items = ((k, _get_with_key(value, k)) for k in self.select(handler, obj))
+        if nxt is None:
+            for k, v in items:
+                handler.set(obj, k, v)
+        else:
+            for k, v in items:
+                nxt.set(handler.get(obj, k), v)
+
+    def delete(self, obj):
+        handler = handler_for(obj)
+        if self.next is None:
+            handler.delete_keys(obj, self.select(handler, obj))
+        else:
+            for k in self.select(handler, obj):
+                self.next.delete(handler.get(obj, k))
+
+    def set_copy(self, obj, value):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        if handler.indexed:
+            items = [(j, _get_with_index(value, i)) for i, j in enumerate(self.select(handler, obj))]
+        else:
+            items = [(k, _get_with_key(value, k)) for k in self.select(handler, obj)]
+        if nxt is not None:
+            items = [(k, nxt.set_copy(get(obj, k), v)) for k, v in items]
+        return _copy_with(handler, obj, items)
+
+    def delete_copy(self, obj):
+        handler = handler_for(obj)
+        keys = self.select(handler, obj)
+        if not len(keys):
+            return obj
+        if self.next is None:
+            new = handler.copy(obj)
+            handler.delete_keys(new, keys)
+            return new
+        get, delete_copy = handler.get, self.next.delete_copy
+        return _copy_with(handler, obj, [(k, delete_copy(get(obj, k))) for k in keys])
+
+    def get_mapped(self, obj, func):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        if nxt is None:
+            return handler.new(obj, ((k, func(get(obj, k))) for k in self.select(handler, obj)))
+        return handler.new(obj, ((k, nxt.get_mapped(get(obj, k), func)) for k in self.select(handler, obj)))
+
+    def apply(self, obj, func):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        if nxt is None:
+            for k in self.select(handler, obj):
+                handler.set(obj, k, func(get(obj, k)))
+        else:
+            for k in self.select(handler, obj):
+                nxt.apply(get(obj, k), func)
+
+    def pop(self, obj):
+        handler = handler_for(obj)
+        get, nxt = handler.get, self.next
+        keys = self.select(handler, obj)
+        if nxt is not None:
+            return handler.new(obj, ((k, nxt.pop(get(obj, k))) for k in keys))
+        result = handler.new(obj, ((k, get(obj, k)) for k in keys))
+        handler.delete_keys(obj, keys)
+        return result
+
+
+def _copy_with(handler, obj, items):
+    """ returns a copy of 'obj' with the (key, value) items set, or 'obj' itself if no value changes """
+    probe = handler.probe
+    items = [(k, v) for k, v in items if v is not probe(obj, k, _marker)]
+    if not items:
+        return obj
+    new = handler.copy(obj)
+    for k, v in items:
+        handler.set(new, k, v)
+    return new
+
+
+def make_step(key, expression=None):
+    """ creates the step for a single key of a path; 'expression' is the parsed key if the key is wild """
+    if expression is not None:
+        return WildStep(key, expression)
+    try:
+        int(key)
+    except (TypeError, ValueError):
+        return KeyStep(key)
+    return IndexStep(key)
+
+
+class Plan(tuple):
+    """
+    Flat, compiled form of a path: a tuple of chained steps. Running the plan does not create any new path objects.
+    """
+
+    def __new__(cls, steps=()):
+        self = tuple.__new__(cls, steps)
+        for step, next_step in zip(self, self[1:]):
+            step.next = next_step
+        return self
+
+    @property
+    def depth(self):
+        """ number of wild steps - 1: the nesting depth of the result of get() """
+        return sum(1 for step in self if isinstance(step, WildStep)) - 1
+
+    def get(self, obj, default=_marker):
+        if not len(self):
+            return obj
+        return self[0].get(obj, default)
+
+    def has(self, obj):
+        """ whether get() would succeed; stops at the first missing key """
+        return not len(self) or self[0].has(obj)
+
+    def has_any(self, obj):
+        """ whether there is at least one match; stops at the first match """
+        for _ in self.items(obj):
+            return True
+        return False
+
+    def get_flat(self, obj, default=_marker):
+        """ returns the values get() would return in a nested structure as a flat list """
+        if not len(self):
+            return [obj]
+        out = []
+        self[0].get_flat(obj, default, out)
+        return out
+
+    def items(self, obj):
+        """ iterates over the (keys, value) of all matches of the plan in 'obj', see WildPath.items """
+        if not len(self):
+            return iter([((), obj)])
+        return self[0].items(obj)
+
+    def get_mapped(self, obj, func):
+        if not len(self):
+            return func(obj)
+        return self[0].get_mapped(obj, func)
+
+    def set(self, obj, value):
+        return self[0].set(obj, value)
+
+    def set_copy(self, obj, value):
+        return self[0].set_copy(obj, value)
+
+    def delete_copy(self, obj):
+        return self[0].delete_copy(obj)
+
+    def apply(self, obj, func):
+        return self[0].apply(obj, func)
+
+    def delete(self, obj):
+        return self[0].delete(obj)
+
+    def pop(self, obj):
+        return self[0].pop(obj)
@@ -1,25 +1,104 @@
-from collections import Mapping, Sequence
+from collections import OrderedDict
+from operator import itemgetter
+from threading import Lock
 
-try:
-    value_sequence_types = (basestring, bytearray, bytes, buffer)
-except NameError:
-    value_sequence_types = (str, bytearray, bytes)
+from wildpath.containers import handler_for, value_sequence_types, MAPPING, SEQUENCE
 
 BIGINT = 10**9
 
 
+def iter_flat(item_s, depth=BIGINT):
+    """
+    Iterates over the values in nested sequences and mappings (up to nesting 'depth'), depth first, with an explicit
+    stack; strings and other leaf objects are values.
+    """
+    stack = [(iter((item_s,)), depth)]
+    while stack:
+        items, depth = stack[-1]
+        for item in items:
+            handler = handler_for(item)
+            if depth > -1 and not handler.leaf and handler.kind in (MAPPING, SEQUENCE):
+                stack.append((iter(map(itemgetter(1), handler.items(item))), depth - 1))
+                break
+            yield item
+        else:
+            stack.pop()
+
+
 def flatten(item_s, depth=BIGINT):
     """ turn values in nested sequences and mappings into a flat list """
-    out = []
-    if isinstance(item_s, value_sequence_types):
-        out.append(item_s)
-    if isinstance(item_s, Mapping) and depth>-1:
-        out.extend(sum((flatten(v, depth-1) for v in item_s.values()), []))
-    elif isinstance(item_s, Sequence) and depth>-1:
-        out.extend(sum((flatten(v, depth-1) for v in item_s), []))
-    else:
-        out.append(item_s)
-    return out
+    return list(iter_flat(item_s, depth))
+
+
+try:
+    _move_to_end = OrderedDict.move_to_end
+except AttributeError:  # python 2
+    def _move_to_end(data, key):
+        data[key] = data.pop(key)
+
+
+class LRUCache(object):
+    """
+    Dict-like cache with a maximum size; when full, the least recently used item is removed. Keeps counts of hits,
+    misses and evictions, see stats().
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            _move_to_end(self._data, key)  # most recently used
+            self.hits += 1
+            return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._evict(self.maxsize)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self, maxsize):
+        while len(self._data) > maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict(maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    size=len(self._data), maxsize=self.maxsize)
+
+
+_missing = object()
 
 
 class encoder(object):